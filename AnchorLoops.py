@@ -10,19 +10,35 @@ stop1, chr2, start2, stop2]. The first 4 columns of the feature_of_interest file
 Header not expected in either file. Outputs entire line of the HiChIP file containing loop anchored in the feature of 
 interest with the chr start stop ID of the corresponding feature of interest added to the end.
 
-python3 anchorLoops.py HiChIP_file feature_of_interest_file output_file
+python3 anchorLoops.py HiChIP_file feature_of_interest_file output_file checkpoint=work_dir preview=size preview_unit=unit seed=seed cis_only=yes profile=out.json
 
 @param 	HiChIP_file		path to text file containing HiChIP loop coordinates (chr1 start1 stop1 chr2 start2 stop2)
 				plus additional information such as loop count and fdr in the remaining columns
 @param 	feature_of_interest_file		path to bed file of genomic element of interest
 @param 	output_file		path to output file to write the HiChIP line and the coordinates + ID of the anchored
 						element of interest
+@param 	work_dir		optional work directory in which the parsed HiChIP file and the loops of each chromosome are
+						checkpointed, so a rerun with the same input files resumes instead of starting over (see Checkpoint.py)
+@param 	size		optional number of features or loops to sample for a quick preview run; the sample goes through the
+						usual analysis and output, and the number of anchored features or loops and of output lines is
+						scaled up to the whole input with a 95% confidence interval (see Preview.py)
+@param 	unit		'features' (default) for a reservoir sample of the features or 'loops' for a reservoir sample of the
+						loops of the HiChIP_file
+@param 	seed		random seed of the preview sample (default 0)
+@param 	cis_only	optional 'yes' to drop inter-chromosomal loops while the HiChIP_file is read; by default they are
+						kept and anchored by the contact bin on the feature's chromosome (see LoopIndex.py)
+@param 	profile		optional path to which a low overhead sampling profile of the inputs, anchor (per chromosome) and
+						output stages is written, as speedscope JSON if it ends with .json or else as collapsed stacks for
+						flamegraph.pl (see Profiler.py)
 """
 
 import sys
-import subprocess
-import re
-from collections import OrderedDict
+from collections import Counter
+import Checkpoint
+import LoopIndex
+import Preview
+import Profiler
+import SortedOutput
 
 def write2dict(key, value, dictionary):
 	'''
@@ -42,26 +58,35 @@ def write2dict(key, value, dictionary):
 		dictionary[key] = [value]
 	return(dictionary)
 
-def unpackHiChIPfile(file):
+def parseHiChIPline(line):
 	'''
-	Input is a HiChIP file path and an empty dictionary. Writes the input file to the dictionary with
-	the chromosome as the key and the value as a list of lists containing the line in list format. 
-	Returns the updated dictionary.
+	Splits a line of the HiChIP file into a list, converting the bin coordinates to integers and adding chr in front of
+	the chromosomes if it's not already there.
 
-	@file	file path to text file to be written to the ditctionary
-	@return 	dictionary containing the data in the input file
+	@line	line of the HiChIP file
+	@return 	list of the fields of the line
 	'''
-	dictionary = {}
-	with open(file, 'r') as file:  # write input file line by line to dictionary with chrom as key
-		for line in file:
-			line = line.rstrip('\r\n').split('\t')
-			chrom, line[1], line[2], line[4], line[5] = line[0], int(line[1]), int(line[2]), int(line[4]), int(line[5])
-			if chrom[0:3] != 'chr':  # add chr in front of the chrom # if it's not already there
-				line[0] = 'chr' + line[0]
-				line[3] = 'chr' + line[3]
-			dictionary = write2dict(line[0], line, dictionary)
-	file.close()
-	return(dictionary)
+	line = line.rstrip('\r\n').split('\t')
+	chrom, line[1], line[2], line[4], line[5] = line[0], int(line[1]), int(line[2]), int(line[4]), int(line[5])
+	if chrom[0:3] != 'chr':  # add chr in front of the chrom # if it's not already there
+		line[0] = 'chr' + line[0]
+		line[3] = 'chr' + line[3]
+	return(line)
+
+def unpackHiChIPfile(file, lines=None, cis_only=False):
+	'''
+	Input is a HiChIP file path. Stores every loop of the input file once, indexed by the chromosome and position of both
+	of its contact bins, so inter-chromosomal loops are found from either side (see LoopIndex.py). Returns the index.
+
+	@file	file path to text file to be written to the index
+	@lines 	optional list of lines of the file (e.g. a sample) to write to the index instead of the whole file
+	@cis_only 	whether inter-chromosomal loops are dropped while the file is read
+	@return 	loop index containing the data in the input file
+	'''
+	if lines is not None:
+		return(LoopIndex.buildLoopIndex([parseHiChIPline(line) for line in lines], cis_only))
+	with open(file, 'r') as file:  # write input file line by line to the index
+		return(LoopIndex.buildLoopIndex((parseHiChIPline(line) for line in file), cis_only))
 
 def checkBin(val, Bin):
 	'''
@@ -112,27 +137,14 @@ def loopChecker(start_feature, stop_feature, HiChIP_coordinates):
 		return(True)
 	return(False)  # return False if there is no overlap between the peak and either of the loop bins
 
-def fileLineCounter(file):
-	"""
-	Counts and returns the number of lines in a file provided a file path.
-
-	@file 	file path for file to count the number of lines in
-	@return 	the number of lines in the provided file
-	"""
-	p = subprocess.Popen(["wc", "-l", file], stdout=subprocess.PIPE)  # unix command to count number of lines in file
-	out, err = p.communicate()
-	decoded = out.decode('utf-8')  # decode output from unix shell
-	count = re.search(r"[0-9]+", str(decoded))  # non-greedy search for the line count
-	return(count)
-
-def checkAllLoops(line, HiChIP_dict, output_dict, anchored_features, anchored_loops):
+def checkAllLoops(line, loop_index, output_dict, anchored_features, anchored_loops):
 	"""
 	For a given feature identifies all loops in which it's anchored in one of the contact bins. Writes these loop and
 	features to the output_dict and adds the feature and loop to the anchored_features and anchored_loops set respectively.
 	Reutrns updated output_dict, anchored_features, and anchored_loops.
 	
 	@line 	a line from the features_file contained in a list
-	@HiChIP_dict 	dictionary containing the HiChIP_file data with chromosome as key and value a list of list of the data
+	@loop_index 	loop index of the HiChIP_file data (see LoopIndex.py)
 	@output_dict 	dictionary to which write info about the loops + feature pairs
 	@anchored_features 	set containing genomic coordinates + ID of features that are contained in a chromatin loop
 	@anchored_loops 	set containing the loop genomic coordinates of loops that contain at least one feature
@@ -141,87 +153,164 @@ def checkAllLoops(line, HiChIP_dict, output_dict, anchored_features, anchored_lo
 	@return 	updated anchored_loops
 	"""
 	chrom, start, stop = line[0], line[1], line[2]
-	if chrom in HiChIP_dict.keys():  # check if feature_of_interest chr is represented in the HiChIP data
-		for value in HiChIP_dict[chrom]:  # loop through the HiChIP values associated with the chr of interest
-			loop = value[:6]
-			check = loopChecker(start, stop, loop)  # check if feature peak overlaps with either loop bin
-			if check:  # write lines of HiChIP files to dictionary if they are anchored at one end with the feature of interest
-				write = value[:]
-				write.extend(line[:4])
-				anchored_features.add(tuple(line[3]))
-				anchored_loops.add(tuple(loop))
-				output_dict = write2dict(chrom, write, output_dict)
+	# loops with a contact bin on the feature's chromosome that overlaps the feature peak, from either side of the loop
+	for row in LoopIndex.anchoredRows(loop_index, chrom, start, stop):
+		value = loop_index['rows'][row]
+		loop = value[:6]
+		write = value[:]  # write lines of HiChIP files to dictionary if they are anchored at one end with the feature of interest
+		write.extend(line[:4])
+		anchored_features.add(tuple(line[3]))
+		anchored_loops.add(tuple(loop))
+		output_dict = write2dict(chrom, write, output_dict)
 	return(output_dict, anchored_features, anchored_loops)
 
-def identifyAnchoredLoops(feature_file, HiChIP_dict):
+def parseFeatureLine(line):
+	"""
+	Splits a line of the feature of interest file into a list, converting the start and stop to integers.
+
+	@line 	line of the feature_file
+	@return 	list of the fields of the line
+	"""
+	line = line.strip().split('\t')
+	line[1], line[2] = int(line[1]), int(line[2])
+	return(line)
+
+def readFeatureFile(feature_file, lines=None):
+	"""
+	Reads the feature of interest file into a dictionary with the chromosome as the key and the feature lines in file
+	order as the value.
+
+	@feature_file 	file path to the feature_file
+	@lines 	optional list of lines of the file (e.g. a sample) to read instead of the whole file
+	@return 	dictionary containing chromosome as the key and the value as a list of feature lines in list format
+	"""
+	features = {}
+	if lines is None:
+		with open(feature_file, 'r') as feature_file:  # loop through the feature_of_interest file
+			lines = feature_file.readlines()
+	for line in lines:
+		line = parseFeatureLine(line)
+		features.setdefault(line[0], []).append(line)
+	return(features)
+
+def anchorChromosome(lines, loop_index):
 	"""
-	Takes in feature of interest filepath and HiChIP data contained in a dictionary. Identifies loops that contain features
+	Identifies the loops in which the given features of one chromosome are anchored. Returns the loop + feature pairs of
+	the chromosome and the sets of anchored features and loops.
+
+	@lines 	list of the feature lines of one chromosome
+	@loop_index 	loop index of the HiChIP_file data (see LoopIndex.py)
+	@return 	list of loop line and paired feature genomic coordinates + ID
+	@return 	set of the anchored features
+	@return 	set of the anchored loops
+	"""
+	output_dict, anchored_features, anchored_loops = {}, set(), set()
+	for line in lines:
+		checkAllLoops(line, loop_index, output_dict, anchored_features, anchored_loops)
+	return(output_dict.get(lines[0][0], []), anchored_features, anchored_loops)
+
+def identifyAnchoredLoops(feature_file, loop_index, work_dir=None, lines=None):
+	"""
+	Takes in feature of interest filepath and HiChIP data contained in a loop index. Identifies loops that contain features
 	in one of the bins and writes these loop + feature pairs. Writes these to an output dictionary in which the chromosome 
 	is the key and the values are a list of lists with the inner list containing the loop line plus the paired feature genomic 
 	coordinates + ID. Returns this dictionary. Prints to console the number of unique features anchored in loops and number 
-	of unique loops that have  at least one feature anchored in one of it's contact bins.
+	of unique loops that have  at least one feature anchored in one of it's contact bins. The loops of each chromosome are
+	checkpointed in work_dir if given, so a rerun only processes the chromosomes that did not complete.
 
 	@file 	file path to the feature_file
-	@HiChIP_dict 	dictionary containing the HiChIP_file data with chromosome as key and value a list of list of the data
+	@loop_index 	loop index of the HiChIP_file data (see LoopIndex.py)
+	@work_dir 	path to the checkpoint work directory (see Checkpoint.py) or None
+	@lines 	optional list of lines of the feature_file (e.g. a sample) to use instead of the whole file
 	@return 	dictionary containing chromosome as the key and the value as a list of list of loop line and paired feature 
 				genomic coordinates + ID
 	"""
 	output_dict, anchored_features, anchored_loops = {}, set(), set()
-	with open(feature_file, 'r') as feature_file:  # loop through the feature_of_interest file
-		for line in feature_file:
-			line = line.strip().split('\t')
-			keep = line[:4]
-			line[1], line[2] = int(line[1]), int(line[2])
-			checkAllLoops(line, HiChIP_dict, output_dict, anchored_features, anchored_loops)
-	feature_file.close()
+	for chrom, chrom_lines in readFeatureFile(feature_file, lines).items():
+		if chrom not in loop_index['chroms']:  # check if feature_of_interest chr is represented in the HiChIP data
+			continue
+		with Profiler.section(chrom):  # profile each chromosome separately when profiling is on
+			value, features, loops = Checkpoint.stage(work_dir, 'chrom_' + chrom, anchorChromosome, chrom_lines, loop_index)
+		if value:
+			output_dict[chrom] = value
+		anchored_features.update(features)
+		anchored_loops.update(loops)
 	print('# Number of anchored features =', len(anchored_features))
 	print('# Number of anchored loops =', len(anchored_loops))
 	return(output_dict)
 
-def orderChrDict(chr_dict):
-	'''
-	Orders the list of values in a dictionary by the second and third items in the inner lists. Also orders the keys.
-	Returns sorted dictionary.
-
-	@chr_dict	dictionary whose values are a list of lists
-	@return 	dictionary value lists sorted by the second and third items in the lists contained within the value lists
-	'''
-	for key, value in chr_dict.items():  # sort values for each key
-		chr_dict[key] = sorted(value, key=lambda element: (element[1], element[2]))
-	final_dict = OrderedDict(sorted(chr_dict.items(), key=lambda t: t[0]))  # sort keys and write sorted info to an Ordered Dict
+def previewReport(output_dict, unit, units, total):
+	"""
+	Prints the counts scaled up from the preview sample with their 95% confidence intervals: the number of anchored units
+	and the number of output lines, both sums over the sampled features or loops.
 
-	return(final_dict)
+	@output_dict 	dictionary of the loop + feature pairs found for the sample
+	@unit 	'features' or 'loops'
+	@units 	list of the sampled features or loops in list format
+	@total 	number of features or loops in the input file
+	"""
+	entries = [entry for value in output_dict.values() for entry in value]
+	if unit == 'loops':
+		keys, units = [tuple(entry[:-4]) for entry in entries], [tuple(line) for line in units]  # the HiChIP line of each pair
+	else:
+		keys, units = [tuple(entry[-4:]) for entry in entries], [tuple(line[:4]) for line in units]
+	lines = Counter(keys)
+	sizes = [1] * len(units)
+	print('# Preview of', len(units), 'of', total, unit)
+	estimate = Preview.ratioEstimate([int(key in lines) for key in units], sizes, total, total)
+	print('# Estimated number of anchored', unit, '=', Preview.formatEstimate(estimate))
+	estimate = Preview.ratioEstimate([lines[key] for key in units], sizes, total, total)
+	print('# Estimated number of lines =', Preview.formatEstimate(estimate))
 
-def outputFile(output_dict, file):
-	'''
-	Writes a given dictionary containing lists of string lists to a given output file.
+def getOptionalArguments(optional_arguments):
+	"""
+	Parses the optional command=value arguments given after the positional arguments. Returns a dictionary of the options.
 
-	@output_dict	dictionary containing as the values lists of lists in which the inner lists are lines to be written to the output
-	@file 	string of the file path to which to write the output
-	'''
-	with open(file, 'w') as file:
-		# parse through dictionary writing string lists in all the value lists to the output file
-		for chrom, value in output_dict.items():
-			for entry in value:
-				line = []
-				for item in entry:
-					item = str(item)
-					line.append(item)
-				file.write('\t'.join(line) + '\n')
-	file.close()
-	return('done')
+	@optional_arguments 	list of command=value strings
+	@return 	dictionary of the options
+	"""
+	options = {'checkpoint': None, 'preview': '0', 'preview_unit': 'features', 'seed': '0', 'cis_only': 'no', 'profile': None}
+	for item in optional_arguments:
+		command, value = item.split('=', 1)
+		if command in options:
+			options[command] = value
+	return(options)
 
 def main():
 	HiChIP_file = sys.argv[1]  # assign terminal input to variables
 	feature_file = sys.argv[2]
 	output_file = sys.argv[3]
-	HiChIP_dict = unpackHiChIPfile(HiChIP_file)  # write HiChIP file to a dictionary
-	output_dict = identifyAnchoredLoops(feature_file, HiChIP_dict)  # identify loop and feature pairs
-	sort_output_dict = orderChrDict(output_dict)
-	outputFile(sort_output_dict, output_file)  # write loop and feature pairs to an output file
-	count = fileLineCounter(output_file)
-	if count:  # print the number of loops anchored at one end by the feature of interest
-		print('# Number of lines = {}'.format(count.group(0)))
+	options = getOptionalArguments(sys.argv[4:])
+	preview, unit, seed = int(options['preview']), options['preview_unit'], int(options['seed'])
+	cis_only = options['cis_only'] == 'yes'
+	if options['profile']:  # sample where the time goes with low overhead
+		Profiler.start(options['profile'], 'AnchorLoops')
+	work_dir = options['checkpoint'] if preview == 0 else None  # a preview is quick and is not checkpointed
+	if work_dir:  # resume from the checkpoints of a previous run with the same input files
+		if Checkpoint.openWorkDir(work_dir, Checkpoint.runKey(['AnchorLoops', cis_only], [HiChIP_file, feature_file])):
+			print('# Resuming from the checkpoints in', work_dir)
+
+	units, feature_lines = None, None
+	with Profiler.section('inputs'):
+		if preview > 0:  # analyze a reservoir sample of the loops or features
+			with open(HiChIP_file if unit == 'loops' else feature_file, 'r') as file:
+				lines, total = Preview.reservoirSample(file, preview, seed)
+			if unit == 'loops':
+				loop_index = unpackHiChIPfile(HiChIP_file, lines, cis_only)
+				units = [parseHiChIPline(line) for line in lines]
+			else:
+				feature_lines = lines
+				units = [parseFeatureLine(line) for line in lines]
+		if unit != 'loops' or preview == 0:
+			loop_index = Checkpoint.stage(work_dir, 'inputs', unpackHiChIPfile, HiChIP_file, None, cis_only)  # index the HiChIP loops
+	with Profiler.section('anchor'):
+		output_dict = identifyAnchoredLoops(feature_file, loop_index, work_dir, feature_lines)  # identify loop and feature pairs
+	with Profiler.section('output'):
+		count = SortedOutput.writeSortedOutput(output_dict, output_file)  # write sorted loop and feature pairs to an output file
+	print('# Number of lines = {}'.format(count))  # print the number of loops anchored at one end by the feature of interest
+	if units is not None:
+		previewReport(output_dict, unit, units, total)
+	Profiler.stop()
 
 if __name__ == '__main__':
 	main()
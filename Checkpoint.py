@@ -0,0 +1,148 @@
+"""
+Title:		Checkpoint.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Checkpoints of the stages of long MasterConnections.py and AnchorLoops.py runs. The result of every completed stage
+(parsed inputs, deg1 tables, deg2 chains, final degrees; per chromosome in chromosome mode) is pickled to a work
+directory. Files are written to a temporary file and renamed into place, so a job killed mid-write never leaves a
+truncated checkpoint behind. A rerun with the same arguments loads the completed stages instead of recomputing them;
+the checkpoints of a different run (other arguments or changed input files) in the work directory are removed first.
+Only the files written here are ever removed, and a non-empty directory without checkpoints is not used.
+"""
+
+import os
+import pickle
+import tempfile
+
+KEY_FILE = 'run_key.txt'
+CHECKPOINT_SUFFIX = '.checkpoint.pkl'  # suffix of the stage checkpoints, so only they are removed when a run changes
+TMP_PREFIX = '.tmp_'
+
+
+def runKey(arguments, files):
+	'''
+	Returns the key identifying a run: its arguments and the size and modification time of its input files.
+
+	@arguments 	list of the arguments that determine the results
+	@files 	list of input file paths
+	@return 	string key
+	'''
+	stats = []
+	for file in files:
+		stat = os.stat(file)
+		stats.append((os.path.abspath(file), stat.st_size, stat.st_mtime_ns))
+	return(repr((list(arguments), stats)))
+
+
+def atomicWrite(path, data, binary=True):
+	'''
+	Writes data to a file by writing a temporary file in the same directory and renaming it into place.
+
+	@path 	file path to write
+	@data 	bytes (or str if binary is False) to write
+	@binary 	whether data is bytes
+	'''
+	directory = os.path.dirname(os.path.abspath(path))
+	handle, tmp_path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX)
+	try:
+		with os.fdopen(handle, 'wb' if binary else 'w') as file:
+			file.write(data)
+			file.flush()
+			os.fsync(file.fileno())
+		os.replace(tmp_path, path)
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+
+def openWorkDir(work_dir, key):
+	'''
+	Prepares a work directory for a run: creates it, or removes its checkpoints if they were written by a run with a
+	different key. A non-empty directory without a key file is refused, so checkpoint= never points at a data directory.
+
+	@work_dir 	path to the work directory
+	@key 	run key (see runKey)
+	@return 	True if checkpoints of the same run are resumed
+	'''
+	os.makedirs(work_dir, exist_ok=True)
+	key_file = os.path.join(work_dir, KEY_FILE)
+	if os.path.exists(key_file):
+		with open(key_file, 'r') as file:
+			if file.read() == key:
+				return(True)
+		print('# Checkpoints in', work_dir, 'are from a different run; starting over')
+		clearCheckpoints(work_dir)
+	elif os.listdir(work_dir):
+		raise ValueError('Checkpoint directory ' + work_dir + ' is not empty and holds no checkpoints; give a new or empty directory')
+	atomicWrite(key_file, key, binary=False)
+	return(False)
+
+
+def clearCheckpoints(work_dir):
+	'''
+	Removes the stage checkpoints and leftover temporary files written by this module from a work directory and its
+	subdirectories (the chromosomes in chromosome mode). Other files are left alone.
+
+	@work_dir 	path to the work directory
+	'''
+	for root, dirs, files in os.walk(work_dir):
+		for name in files:
+			if name.endswith(CHECKPOINT_SUFFIX) or name.startswith(TMP_PREFIX):
+				os.remove(os.path.join(root, name))
+
+
+def checkpointPath(work_dir, name):
+	'''
+	Returns the file path of a stage checkpoint.
+
+	@work_dir 	path to the work directory
+	@name 	name of the stage
+	@return 	file path of the checkpoint
+	'''
+	return(os.path.join(work_dir, name + CHECKPOINT_SUFFIX))
+
+
+def done(work_dir, name):
+	'''
+	Returns whether a stage has a checkpoint.
+
+	@work_dir 	path to the work directory or None when checkpointing is off
+	@name 	name of the stage
+	@return 	boolean
+	'''
+	return(work_dir is not None and os.path.exists(checkpointPath(work_dir, name)))
+
+
+def load(work_dir, name):
+	'''
+	Loads the result of a completed stage from its checkpoint.
+
+	@work_dir 	path to the work directory
+	@name 	name of the stage
+	@return 	result of the stage
+	'''
+	with open(checkpointPath(work_dir, name), 'rb') as file:
+		return(pickle.load(file))
+
+
+def stage(work_dir, name, function, *args):
+	'''
+	Returns the result of a stage: loaded from its checkpoint if it completed before, otherwise computed by calling
+	function(*args) and checkpointed. Without a work directory the function is simply called.
+
+	@work_dir 	path to the work directory or None when checkpointing is off
+	@name 	name of the stage
+	@function 	function computing the stage
+	@args 	arguments of the function
+	@return 	result of the stage
+	'''
+	if work_dir is None:
+		return(function(*args))
+	if done(work_dir, name):
+		return(load(work_dir, name))
+	result = function(*args)
+	os.makedirs(work_dir, exist_ok=True)
+	atomicWrite(checkpointPath(work_dir, name), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+	return(result)
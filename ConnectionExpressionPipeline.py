@@ -0,0 +1,96 @@
+"""
+Title:		ConnectionExpressionPipeline.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Runs MasterConnections.py and Generate_Gene_Log2FC_ecdf.py in one process. The 0°, 1°, 2° and 3° connections between the
+TSSs and the target are found as in MasterConnections.py, then the genes connected by each degree, by only one degree,
+by each exclusive combination of degrees and by any degree are joined in memory against the parsed log2 fold change
+table. For every gene set an ecdf against all protein-coding genes is made and the t-test (and optional permutation)
+statistics are written to a single summary table, without intermediate gene list files.
+
+python3 ConnectionExpressionPipeline.py HiChIP_target_file HiChIP_element1_file HiChIP_element2_file target_file target_name
+	gene_file gene_name element1_file element1_name element2_file element2_name promoter_dist file_input_gene_fc output_prefix
+
+@HiChIP_target_file ... @promoter_dist 	as for MasterConnections.py
+@file_input_gene_fc 	csv file of the log2 fold change in gene expression level (see Generate_Gene_Log2FC_ecdf.py)
+@output_prefix 	prefix of the output files: <output_prefix>_<gene set>.pdf for each gene set (e.g. _deg1.pdf,
+				_deg1_only.pdf, _deg0_deg1.pdf, _all_connected.pdf) and <output_prefix>_summary.tsv
+
+Optional arguments are given as command=value after the positional arguments: engine (as for MasterConnections.py),
+processes (used for parsing the inputs and rendering the ecdfs), permutations, ks, seed, max_points and tables (as for
+Generate_Gene_Log2FC_ecdf.py).
+"""
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import MasterConnections
+import Generate_Gene_Log2FC_ecdf
+
+DEGREE_COLORS = {'deg0': 'b', 'deg1': 'g', 'deg2': 'r', 'deg3': 'm'}
+
+
+def getOptionalArguments(optional_arguments):
+# parse optional command=value arguments given after the positional arguments
+	options = {'engine': 'loops', 'processes': '1', 'permutations': '0', 'ks': 'no', 'seed': '0', 'max_points': '0', 'tables': 'no'}
+	for item in optional_arguments:
+		command, value = item.split('=', 1)
+		if command in options:
+			options[command] = value
+	return(options)
+
+
+def geneSetColor(key):
+# color of the ecdf of a gene set: the color of its degree, cyan for combinations of degrees and yellow for all genes
+	if key == 'all_connected':
+		return('y')
+	degree = key.replace('_only', '')
+	return(DEGREE_COLORS.get(degree, 'c'))
+
+
+def geneSetSubsets(gene_sets, gene_name, output_prefix):
+# converts the connected gene sets into the subsets compared by Generate_Gene_Log2FC_ecdf.compare_subsets
+	list_subsets = []
+	for key, genes in gene_sets.items():
+		if not genes:  # nothing to compare for degrees or combinations without any gene
+			print('# No', gene_name, 'in', key, '; skipped')
+			continue
+		list_subsets.append((key, genes, output_prefix + '_' + key + '.pdf', gene_name + ' ' + key, geneSetColor(key)))
+	return(list_subsets)
+
+
+def main():
+	HiChIP_target_file, HiChIP_element1_file, HiChIP_element2_file = sys.argv[1], sys.argv[2], sys.argv[3]
+	target_file, target_name = sys.argv[4], sys.argv[5]
+	gene_file, gene_name = sys.argv[6], sys.argv[7]
+	element1_file, element1_name = sys.argv[8], sys.argv[9]
+	element2_file, element2_name = sys.argv[10], sys.argv[11]
+	promoter_dist = int(sys.argv[12])
+	file_input_gene_fc = sys.argv[13]
+	output_prefix = sys.argv[14]
+	options = getOptionalArguments(sys.argv[15:])
+	processes = int(options['processes'])
+	names = (gene_name, target_name, element1_name, element2_name)
+	files = {'HiChIP_target': HiChIP_target_file, 'HiChIP_element1': HiChIP_element1_file, 'HiChIP_element2': HiChIP_element2_file, \
+		'target': target_file, 'gene': gene_file, 'element1': element1_file, 'element2': element2_file}
+
+	# connections between TSSs and the target
+	if processes > 1:
+		with ProcessPoolExecutor(max_workers=min(processes, len(files))) as executor:
+			inputs = MasterConnections.loadInputs(files, names, promoter_dist, executor=executor)
+	else:
+		inputs = MasterConnections.loadInputs(files, names, promoter_dist)
+	degrees = MasterConnections.runAnalysis(inputs, options['engine'])
+	MasterConnections.printDegreeCounts(degrees, names)
+	mixed = MasterConnections.summarizeConnections(degrees['deg0'], degrees['deg1'], degrees['deg2'], degrees['deg3'], gene_name, target_name)
+	gene_sets = MasterConnections.connectionGeneSets(degrees, mixed)
+
+	# expression changes of the connected genes compared to all protein-coding genes
+	genes, all_fc = Generate_Gene_Log2FC_ecdf.load_fc_table(file_input_gene_fc)
+	list_subsets = geneSetSubsets(gene_sets, gene_name, output_prefix)
+	Generate_Gene_Log2FC_ecdf.compare_subsets(genes, all_fc, list_subsets, output_prefix + '_summary.tsv', processes, \
+		int(options['permutations']), options['ks'] == 'yes', int(options['seed']), int(options['max_points']), options['tables'] == 'yes')
+
+
+if __name__ == '__main__':
+	main()
@@ -10,7 +10,7 @@ contact bins) in the HiChIP input file. The second element is contained in a bed
 ID of the second element, the loop read count, fdr, & ID, and the anchored first element coordinates plus ID. Prints to
 console the number of unique second elements attached to at least one of the anchored elements.
 
-python Deg1LoopChecker.py HiChIP_file anchor_name target_file target_name output_file
+python Deg1LoopChecker.py HiChIP_file anchor_name target_file target_name output_file database=database_file cis_only=yes profile=out.json
 
 @param 	HiChIP_file		path to text file containing HiChIP loop coordinates (chr1 start1 stop1 chr2 start2 stop2)
 				plus additional information such as loop count and fdr in the remaining columns
@@ -19,10 +19,19 @@ python Deg1LoopChecker.py HiChIP_file anchor_name target_file target_name output
 @param 	target_name		text label of data type of the second element
 @param 	output_file		path to output file to write the second element coordinates + ID, loop count + fdr + ID, and the
 						anchored elements coordinates + ID
+@param 	database_file	optional path to a SQLite database to which the output is also written as a typed table named
+						target_name_anchor_name, indexed by chromosome, ID and anchor (see ResultDatabase.py)
+@param 	cis_only		optional 'yes' to drop inter-chromosomal loops while the HiChIP_file is read; otherwise the distal
+						bin of an inter-chromosomal loop is compared with the targets of its own chromosome
+@param 	profile			optional path to which a low overhead sampling profile of the inputs, deg1 (per chromosome) and
+						output stages is written, as speedscope JSON if it ends with .json or else as collapsed stacks for
+						flamegraph.pl (see Profiler.py)
 '''
 
 import sys
-from collections import OrderedDict
+import LoopIndex
+import Profiler
+import SortedOutput
 
 def write2dict(key, value, dictionary):
 	'''
@@ -57,6 +66,23 @@ def unpackFile2ChrDict(file):
 			chrom, line[1], line[2] = line[0], int(line[1]), int(line[2])
 			dictionary = write2dict(chrom, line, dictionary)
 	return(dictionary)
+
+def unpackHiChIPFile(file, cis_only=False):
+	'''
+	Reads the HiChIP file, storing identical lines once (see LoopIndex.uniqueLoops). Returns a
+	dictionary in which every loop is listed under the chromosome of each of its contact bins.
+
+	@file	file path to the HiChIP file (chr1 start1 stop1 chr2 start2 stop2 ...)
+	@cis_only 	whether inter-chromosomal loops (chr1 != chr2) are dropped while the file is read
+	@return 	dictionary with chrom as key and the list of loops in list format with a contact bin on it as value
+	'''
+	lines = []
+	with open(file, 'r') as file:
+		for line in file:
+			line = line.rstrip('\r\n').split('\t')
+			line[1], line[2], line[4], line[5] = int(line[1]), int(line[2]), int(line[4]), int(line[5])
+			lines.append(line)
+	return(LoopIndex.chromosomeRows(LoopIndex.uniqueLoops(lines, cis_only)))
 '''
 Returns a boolean concerning if a given integer falls within a given range.
 
@@ -106,30 +132,30 @@ def binChecker(start, stop, Bin):
 		return(False)
 
 '''
-Input is a list containing the genomic start stop coordinates of an element, another list containing the 
-genomic start stop coordinates of a second element, and the last containing the genomic coordinates of a loop
-(chr1 start1 stop1 chr2 start2 stop2). Assumes that the loop is intra-chromasomal and that both elements are
-known to be contained on the same chromosome as the loop. Returns True if the first element is in one contact 
-bin of the loop and the second element is on the other contact bin of the loop. Otherwise it returns False.
+Input is a list containing the genomic coordinates of an element, another list containing the genomic
+coordinates of a second element, and the last containing the genomic coordinates of a loop (chr1 start1 stop1
+chr2 start2 stop2). A contact bin only holds an element on its own chromosome, so inter-chromosomal loops connect
+elements on their two chromosomes. Returns True if the first element is in one contact bin of the loop and the
+second element is on the other contact bin of the loop. Otherwise it returns False.
 
-@feature 	list containing genomic start and stop coordinates (but not chr) of the first element of interest
-@anchor 	list containing genomic start and stop coordinates (but not chr) of the second element of interest
+@feature 	list containing genomic chr, start and stop coordinates of the first element of interest
+@anchor 	list containing genomic chr, start and stop coordinates of the second element of interest
 @loop 		genomic coordinates of the loop (chr1 start1 stop1 chr2 start2 stop2)
 '''
 def DistalConnectCheck(feature, anchor, loop):
 # identifies which end of the loop the anchor is associated and checks if the feature is on the other end of the loop
-	feature_start, feature_stop = int(feature[0]), int(feature[1])
-	anchor_start, anchor_stop = int(anchor[0]), int(anchor[1])
+	feature_chrom, feature_start, feature_stop = feature[0], int(feature[1]), int(feature[2])
+	anchor_chrom, anchor_start, anchor_stop = anchor[0], int(anchor[1]), int(anchor[2])
 	loop1 = [int(loop[1]), int(loop[2])]
 	loop2 = [int(loop[4]), int(loop[5])]
 
-	check = binChecker(anchor_start, anchor_stop, loop1)
+	check = anchor_chrom == loop[0] and binChecker(anchor_start, anchor_stop, loop1)
 	if check:
-		isin0 = binChecker(feature_start, feature_stop, loop2)
+		isin0 = feature_chrom == loop[3] and binChecker(feature_start, feature_stop, loop2)
 		if isin0:
 			return('yes')
-	else:  # anchor is in bin 2 and check if feature is in bin 1
-		isin1 = binChecker(feature_start, feature_stop, loop1)
+	elif anchor_chrom == loop[3]:  # anchor is in bin 2 and check if feature is in bin 1
+		isin1 = feature_chrom == loop[0] and binChecker(feature_start, feature_stop, loop1)
 		if isin1:  # write lines of HiChIP files to dictionary if they are anchored at one end with the feature of interest
 			return('yes')
 	return(False)
@@ -150,11 +176,11 @@ def countUniqueID(dictionary):
 '''
 Input is the dictionaries containing the info from the HiChIP file and second element file as well as the identities of the 
 elements in each of these files. Identify contacts in which the anchor element is in one contact bin and the target is in the
-other contact bin of a chromosome loop. If it is write the second element coordinates + ID, loop count + fdr + ID, and anchor
+other contact bin of a chromosome loop, which may join two chromosomes. If it is write the second element coordinates + ID, loop count + fdr + ID, and anchor
 element coordinates + ID to a dictionary with the chromosome as the key and list containing that info in a list as the value.
 Return the dictionary.
 
-@HiChIP_dict 	dictionary with HiChIP input file info with the chromosome as the key and a list of lists as the value
+@HiChIP_dict 	dictionary with HiChIP input file info with the chromosome of each contact bin as the key and a list of lists as the value
 @anchor_name 	the type of data the anchor element is in the HiChIP file
 @target_dict	dictionary with second element input file info with the chromosome as the key and a list of lists as the value
 @target_name 	the type of data the element in the second element file
@@ -164,47 +190,32 @@ def deg1Analysis(HiChIP_dict, anchor_name, target_dict, target_name):
 	output_dict = {}
 	for chrom, value in HiChIP_dict.items():  # loop over HiChIP_dict and target_dicts
 		if chrom in target_dict:
-			for item in value:  # define elements start stop and loop coordinates
-				loop = item[:6]
-				anchor = [int(item[10]), int(item[11])]
-				for line in target_dict[chrom]:  # check if one element is in one contact bin and the other is the other bin
-					feature = [line[1], line[2]]
-					check = DistalConnectCheck(feature, anchor, loop)
-					if check:  # write info of elements and loop to dictionary if it's in the correct configuration
-						keep = line[0:4]
-						keep.extend(item[6:13])
-						output_dict = write2dict(chrom, keep, output_dict)
+			with Profiler.section(chrom):  # profile each chromosome separately when profiling is on
+				for item in value:  # define elements start stop and loop coordinates
+					loop = item[:6]
+					anchor = [item[9], int(item[10]), int(item[11])]
+					for line in target_dict[chrom]:  # check if one element is in one contact bin and the other is the other bin
+						feature = line[0:3]
+						check = DistalConnectCheck(feature, anchor, loop)
+						if check:  # write info of elements and loop to dictionary if it's in the correct configuration
+							keep = line[0:4]
+							keep.extend(item[6:13])
+							output_dict = write2dict(chrom, keep, output_dict)
 	return(output_dict)
 
 '''
-Orders the list of values in a dictionary by the second and third items in the inner lists. Returns sorted dictionary.
+Parses the optional command=value arguments given after the positional arguments. Returns a dictionary of the options.
 
-@chr_dict	dictionary whose values are a list of lists
-@return 	dictionary value lists sorted by the second and third items in the lists contained within the value lists
+@optional_arguments 	list of command=value strings
+@return 	dictionary of the options
 '''
-def orderChrDict(chr_dict):  # orders keys in dictionary and sorts values by second component of values
-	for key, value in chr_dict.items():  # sort values for each key
-		chr_dict[key] = sorted(value, key=lambda element: (element[1], element[2]))
-	final_dict = OrderedDict(sorted(chr_dict.items(), key=lambda t: t[0]))  # sort keys and write sorted info to an Ordered Dict
-
-	return(final_dict)
-
-def outputFile(output_dict, file):
-	'''
-	Writes a given dictionary containing lists of string lists to a given output file.
-
-	@output_dict	dictionary containing as the values lists of lists in which the inner lists are lines to be written to the output
-	@file 	string of the file path to which to write the output
-	'''
-	with open(file, 'w') as file:
-		# parse through dictionary writing string lists in all the value lists to the output file
-		for chrom, value in output_dict.items():
-			for entry in value:
-				line = []
-				for item in entry:
-					item = str(item)
-					line.append(item)
-				file.write('\t'.join(line) + '\n')
+def getOptionalArguments(optional_arguments):
+	options = {'database': None, 'cis_only': 'no', 'profile': None}
+	for item in optional_arguments:
+		command, value = item.split('=', 1)
+		if command in options:
+			options[command] = value
+	return(options)
 
 def main():
 	HiChIP_file = sys.argv[1]  # write input parameters to variables
@@ -212,14 +223,23 @@ def main():
 	target_file = sys.argv[3]
 	target_name = sys.argv[4]
 	output_file = sys.argv[5]
-	HiChIP_dict = unpackFile2ChrDict(HiChIP_file)
-	target_dict = unpackFile2ChrDict(target_file)
-	output_dict = deg1Analysis(HiChIP_dict, anchor_name, target_dict, target_name)  # identify contacts with target in opposite bin as the anchor
+	options = getOptionalArguments(sys.argv[6:])
+	if options['profile']:  # sample where the time goes with low overhead
+		Profiler.start(options['profile'], 'Deg1LoopChecker')
+	with Profiler.section('inputs'):
+		HiChIP_dict = unpackHiChIPFile(HiChIP_file, options['cis_only'] == 'yes')
+		target_dict = unpackFile2ChrDict(target_file)
+	with Profiler.section('deg1'):
+		output_dict = deg1Analysis(HiChIP_dict, anchor_name, target_dict, target_name)  # identify contacts with target in opposite bin as the anchor
 	count = countUniqueID(output_dict)  # 
 	print('# Number of', target_name, 'is directly looped to', anchor_name, '(i.e. 1° connection to', anchor_name, ') =', count)
-	sort_output_dict = orderChrDict(output_dict)  # order the output data by genomic location in each on
-
-	outputFile(sort_output_dict, output_file)  # write contacts of interest to new output file (subset of original input file)
+	# write contacts of interest ordered by genomic location to new output file (subset of original input file)
+	with Profiler.section('output'):
+		SortedOutput.writeSortedOutput(output_dict, output_file)
+		if options['database']:
+			import ResultDatabase
+			ResultDatabase.writeTable(options['database'], target_name + '_' + anchor_name, output_dict, ResultDatabase.DEG1_LOOP_CHECKER)
+	Profiler.stop()
 
 if __name__ == '__main__':
 	main()
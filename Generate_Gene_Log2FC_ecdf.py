@@ -16,9 +16,33 @@ python3 Generate_Gene_Log2FC_ecdf.py file_input_gene_fc file_input_subset_gene_l
 @subset_gene_name				name of subset of genes (for print out statements)
 @color							specify color for subset of colors in graph; string of the appropriate 
 								color denoter for plt.plot; optional arguement; default value is green ('g')
+
+Batch mode compares many subsets of genes, loading the fold change csv once and rendering the ecdfs
+in a pool of processes:
+
+python3 Generate_Gene_Log2FC_ecdf.py file_input_gene_fc batch=file_input_manifest summary=file_output_summary processes=processes
+
+Batch mode is selected by giving batch=file_input_manifest as the first arguement after file_input_gene_fc.
+
+@file_input_manifest			tab-delimited file with one subset per line: file_input_subset_gene_list,
+								file_output_pdf, subset_gene_name and optionally color
+@file_output_summary			filepath to save the tab-delimited table of the size and t-test p-value of each subset;
+								optional arguement; defaults to <manifest name>_summary.tsv next to the manifest
+@processes						number of processes used to render the ecdfs; optional arguement; default value is 1
+
+Both modes take the optional arguements permutations=number_of_permutations ks=yes seed=seed to also
+report empirical p-values from random sets of protein-coding genes of the same size as the subset
+(two-sided for the difference in mean log2 FC; optionally for the Kolmogorov-Smirnov statistic).
+
+The optional arguement max_points=max_points caps the number of points plotted per ecdf curve, keeping
+the curve within 4/max_points of the axes range of the full curve (e.g. 2000 for visually identical
+plots). The plotted points are written to a tab-delimited file with table=file_output_table, or next
+to each pdf as <pdf name>_ecdf.tsv with tables=yes in batch mode.
 """
 
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np  # version=1.20.2
 import matplotlib.pyplot as plt  # version=3.4.1
 from scipy import stats as stats  # version=1.6.2
@@ -28,85 +52,131 @@ plt.rcParams['pdf.fonttype'] = 42
 # define universal variables
 X_LIM_MIN = -2
 X_LIM_MAX = 2
+PERMUTATION_BATCH = 2**22  # number of random draws (gene sets x protein-coding genes) held in memory at a time
 
 
 def get_optional_arguments(optional_arguments):
+	options = {'color': 'g', 'batch': None, 'summary': None, 'processes': '1', 'permutations': '0', 'ks': 'no', 'seed': '0',
+		'max_points': '0', 'table': None, 'tables': 'no'}
 	for item in optional_arguments:
-		command, value = item.split('=')
-		if command == 'color':
-			c = value
-	return c
+		command, value = item.split('=', 1)  # the value may be a path containing '='
+		if command in options:
+			options[command] = value
+	return options
 
 
-def add_fc_to_dict(d, k, v):
-	if k in d:
-		d[k].append(v)
-	else:
-		d[k] = [v]
-	return d
-
-
-def average_values(d):
-	# average values for multiple log2 fold changes reported for the same gene symbol
-	d_final = {}
-	for k, v in d.items():
-		v_final = sum(v)/len(v)
-		d_final[k] = v_final
-	return d_final
-
-
-def write_fc_to_dict(file_input_gene_fc):
-	dict_fc = {}
-	f = open(file_input_gene_fc, 'r')
-	f.readline()
-	for l in f:
-		l = l.rstrip('\r\n').split(',')
-		fc, gene_type, gene_symbol = l[2], l[10], l[11]
-		gene_type = gene_type.strip('"')
-		gene_symbol = gene_symbol.strip('"')
-		if fc == 'NA':  # replace fc missing values with 0
-			fc = 0
-		fc = float(fc)
-		if gene_type == 'protein_coding':
-			dict_fc = add_fc_to_dict(dict_fc, gene_symbol, fc)
-	return average_values(dict_fc)
-
-
-def read_subset_file_to_list(file_input_subset_gene_list):
-	list_subset_genes = []
-	f = open(file_input_subset_gene_list, 'r')
-	for l in f:
-		l = l.rstrip('\r\n').split(',')
-		list_subset_genes.append(l[0])
-	return list_subset_genes
+def read_fc_file(file_input_gene_fc):
+	# parse the csv in bulk into arrays of gene symbols and log2 fold changes of the protein-coding genes
+	with open(file_input_gene_fc, 'r') as f:
+		f.readline()
+		rows = [l.rstrip('\r\n').split(',') for l in f]
+	gene_type = np.array([l[10].strip('"') for l in rows])
+	keep = gene_type == 'protein_coding'
+	gene_symbols = np.array([l[11].strip('"') for l in rows])[keep]
+	fc = np.array([l[2] for l in rows])[keep]
+	fc[fc == 'NA'] = '0'  # replace fc missing values with 0
+	return gene_symbols, fc.astype(float)
+
+
+def average_values(gene_symbols, fc):
+	# average values for multiple log2 fold changes reported for the same gene symbol with a vectorized group-by;
+	# genes are returned in order of first appearance
+	genes, first, inverse = np.unique(gene_symbols, return_index=True, return_inverse=True)
+	inverse = inverse.ravel()
+	mean_fc = np.bincount(inverse, weights=fc) / np.bincount(inverse)
+	order = np.argsort(first)
+	return genes[order], mean_fc[order]
+
+
+def load_fc_table(file_input_gene_fc):
+	# protein-coding gene symbols and their averaged log2 fold changes as arrays
+	gene_symbols, fc = read_fc_file(file_input_gene_fc)
+	return average_values(gene_symbols, fc)
+
+
+def read_subset_file_to_set(file_input_subset_gene_list):
+	set_subset_genes = set()
+	with open(file_input_subset_gene_list, 'r') as f:
+		for l in f:
+			l = l.rstrip('\r\n').split(',')
+			set_subset_genes.add(l[0])
+	return set_subset_genes
+
+
+def select_subset_fc(genes, fc, subset_genes):
+	# fold changes of the genes in the subset by sorted-index membership
+	subset_genes = np.array(sorted(subset_genes), dtype=str)
+	return fc[np.isin(genes, subset_genes)]
 
 
 def make_fc_lists(file_input_gene_fc, file_input_subset_gene_list):
-	# write protein-coding genes fold change to dict
-	dict_fc = write_fc_to_dict(file_input_gene_fc)
+	# parse protein-coding genes fold change to arrays
+	genes, all_fc = load_fc_table(file_input_gene_fc)
+
+	# generate fc arrays for subset of genes and all protein-coding genes
+	subset_genes = read_subset_file_to_set(file_input_subset_gene_list)
+	subset_fc = select_subset_fc(genes, all_fc, subset_genes)
+
+	return subset_fc, all_fc
+
 
-	# generate fc lists for subset of genes and all protein-coding genes
-	list_all_fc = list(dict_fc.values())
-	list_subset_genes = read_subset_file_to_list(file_input_subset_gene_list)
-	list_subset_fc = list({k: v for k, v in dict_fc.items() if k in list_subset_genes}.values())
+def ecdf_points(entry):
+	# sorted values and cumulative fractions plotted for an ecdf
+	sort_entry = np.sort(entry)
+	p = 1. * np.arange(len(entry))/(len(entry) - 1)
+	return sort_entry, p
 
-	return list_subset_fc, list_all_fc
 
+def reduce_ecdf(sort_entry, p, max_points):
+	# keep at most max_points points of an ecdf curve within the plotted range: the axes are divided into cells
+	# of 4/max_points of their range and only the first and last point of the curve in each cell is kept, so the
+	# reduced curve stays within one cell of the full curve (vertical steps from tied values are preserved)
+	inside = (sort_entry >= X_LIM_MIN) & (sort_entry <= X_LIM_MAX)
+	below, above = np.flatnonzero(sort_entry < X_LIM_MIN), np.flatnonzero(sort_entry > X_LIM_MAX)
+	if len(below):  # keep the last point left of the plot and the first point right of it so the curve reaches the edges
+		inside[below[-1]] = True
+	if len(above):
+		inside[above[0]] = True
+	x, y = sort_entry[inside], p[inside]
 
-def make_ecdf(output_file, *data):
+	cells = max(1, max_points // 4)
+	x_cell = np.floor((np.clip(x, X_LIM_MIN, X_LIM_MAX) - X_LIM_MIN) / (X_LIM_MAX - X_LIM_MIN) * cells)
+	y_cell = np.floor(np.clip(y, 0., 1.) * cells)
+	cell = x_cell * (cells + 1) + y_cell
+	keep = np.ones(len(cell), dtype=bool)
+	keep[1:-1] = (cell[1:-1] != cell[:-2]) | (cell[1:-1] != cell[2:])
+	return x[keep], y[keep]
+
+
+def write_ecdf_table(file_output_table, curves):
+	# write the plotted points of each ecdf curve (label, color, log2 FC, cumulative fraction) to a tsv
+	with open(file_output_table, 'w') as f:
+		f.write('curve\tcolor\tlog2_fold_change\tcumulative_fraction\n')
+		for label, color, x, y in curves:
+			f.writelines(['{}\t{}\t{!r}\t{!r}\n'.format(label, color, float(i), float(j)) for i, j in zip(x, y)])
+
+
+def make_ecdf(output_file, *data, max_points=0, file_output_table=None):
 	'''
 	Makes a ecdf. It takes as many datasets as input as desired.
-	Input for each dataset in data list is  (list of fac values, color).
+	Input for each dataset in data list is  (list of fac values, color) or (list of fac values, color, label).
 	Color specification for each dataset must be a string of the appropriate 
-	color denoter for plt.plot.
+	color denoter for plt.plot. If max_points is given each curve is reduced to at most max_points points
+	(see reduce_ecdf). The plotted points are written to file_output_table if given.
 	'''
 	num_bins = 20  # number of bins for log2FC ecdf
 
-	for item in data:
-		entry, color = item
-		sort_entry = np.sort(entry)
-		p = 1. * np.arange(len(entry))/(len(entry) - 1)
+	curves = []
+	for i, item in enumerate(data):
+		entry, color = item[0], item[1]
+		label = item[2] if len(item) > 2 else str(i)
+		sort_entry, p = ecdf_points(entry)
+		if max_points:
+			sort_entry, p = reduce_ecdf(sort_entry, p, max_points)
 		plt.plot(sort_entry, p, color = color)
+		curves.append((label, color, sort_entry, p))
+	if file_output_table:
+		write_ecdf_table(file_output_table, curves)
 	plt.xlim(X_LIM_MIN, X_LIM_MAX)
 	plt.ylim(0.0, 1.0)
 	plt.xlabel('Log2 Fold Change', fontsize = 16)
@@ -122,26 +192,182 @@ def perform_t_test(subset_gene_name, list_subset_fc, list_all_fc):
 	print('#', subset_gene_name, "vs all protein-coding genes by Student's Two-Tail t-test p-value =", p)
 	print('# Number of', subset_gene_name, '=', len(list_subset_fc))
 	print('# Number of all protein-coding genes =', len(list_all_fc))
+	return t, p
+
+
+def permutation_background(list_all_fc):
+	# sorted fold changes of all protein-coding genes (as plotted by make_ecdf), the tie group of each of their
+	# ranks and the ecdf of all protein-coding genes at each distinct fold change
+	sort_fc, p = ecdf_points(list_all_fc)
+	values, group, counts = np.unique(sort_fc, return_inverse=True, return_counts=True)
+	return {'sort_fc': sort_fc, 'values': values, 'group': group.ravel(), 'cdf': np.cumsum(counts) / len(sort_fc)}
+
+
+def ks_statistics(groups, background):
+	# Kolmogorov-Smirnov statistic of each row of tie group ids against all protein-coding genes. With the rows
+	# sorted, the subset ecdf rises above the background at each of its values and falls furthest below it just
+	# before them; positions inside a run of tied values never exceed the ends of the run, so no masking is needed
+	groups = np.sort(groups, axis=1)
+	k = groups.shape[1]
+	cdf = background['cdf']
+	cdf_before = np.concatenate(([0.], cdf[:-1]))
+	i = np.arange(1, k + 1)
+	above = (i / k - cdf[groups]).max(axis=1)
+	below = (cdf_before[groups] - (i - 1) / k).max(axis=1)
+	return np.maximum(above, below)
+
+
+def permutation_null(background, k, n_permutations, ks=False, seed=0):
+	# statistics of n_permutations random sets of k protein-coding genes, drawn without replacement in batches
+	# as ranks of the sorted fold changes
+	rng = np.random.default_rng(seed)
+	sort_fc = background['sort_fc']
+	n = len(sort_fc)
+	batch = max(1, PERMUTATION_BATCH // n)
+	null = {'mean': [], 'ks': []}
+	for start in range(0, n_permutations, batch):
+		size = min(batch, n_permutations - start)
+		ranks = np.argpartition(rng.random((size, n)), k - 1, axis=1)[:, :k]
+		null['mean'].append(np.abs(sort_fc[ranks].mean(axis=1) - sort_fc.mean()))
+		if ks:
+			null['ks'].append(ks_statistics(background['group'][ranks], background))
+	return {key: np.concatenate(value) for key, value in null.items() if value}
+
+
+def perform_permutation_test(subset_gene_name, list_subset_fc, background, n_permutations, ks=False, seed=0, cache=None):
+	# empirical p-values of the subset against random sets of protein-coding genes of the same size; null
+	# distributions are reused from cache (dict keyed by subset size) when given
+	k = len(list_subset_fc)
+	if k == 0:
+		return {'permutation_p': np.nan, 'ks_statistic': np.nan, 'ks_p': np.nan}
+	if cache is not None and k in cache:
+		null = cache[k]
+	else:
+		null = permutation_null(background, k, n_permutations, ks, seed)
+		if cache is not None:
+			cache[k] = null
+	tolerance = 1e-12  # count random sets whose statistic ties with the subset's
+	observed = abs(np.mean(list_subset_fc) - background['sort_fc'].mean())
+	result = {'permutation_p': (1 + np.count_nonzero(null['mean'] >= observed - tolerance)) / (1 + n_permutations)}
+	print('#', subset_gene_name, 'vs', n_permutations, 'random sets of protein-coding genes by two-sided permutation test of the mean p-value =', result['permutation_p'])
+	if ks:
+		groups = np.searchsorted(background['values'], list_subset_fc)[None, :]
+		result['ks_statistic'] = ks_statistics(groups, background)[0]
+		result['ks_p'] = (1 + np.count_nonzero(null['ks'] >= result['ks_statistic'] - tolerance)) / (1 + n_permutations)
+		print('#', subset_gene_name, 'vs all protein-coding genes Kolmogorov-Smirnov statistic =', result['ks_statistic'], 'permutation p-value =', result['ks_p'])
+	return result
+
+
+def read_manifest(file_input_manifest):
+	# one subset per line: subset gene list file, output pdf, subset name and optional color
+	list_subsets = []
+	with open(file_input_manifest, 'r') as f:
+		for l in f:
+			l = l.rstrip('\r\n').split('\t')
+			if len(l) < 3:  # skip blank lines
+				continue
+			c = l[3] if len(l) > 3 and l[3] else 'g'
+			list_subsets.append((l[0], l[1], l[2], c))
+	return list_subsets
+
+
+def set_background_fc(all_fc):
+	# store the fold changes of all protein-coding genes once per worker process
+	global BACKGROUND_FC
+	BACKGROUND_FC = all_fc
+
+
+def render_subset_ecdf(task):
+	# make the ecdf of one subset against the background stored by set_background_fc
+	file_output_pdf, subset_fc, c, subset_gene_name, max_points, file_output_table = task
+	make_ecdf(file_output_pdf, (subset_fc, c, subset_gene_name), (BACKGROUND_FC, 'k', 'all protein-coding genes'),
+		max_points=max_points, file_output_table=file_output_table)
+	return file_output_pdf
+
+
+def run_batch(file_input_gene_fc, file_input_manifest, file_output_summary, processes=1, n_permutations=0, ks=False, seed=0,
+	max_points=0, tables=False):
+	# load the fold changes once and compare every subset of the manifest to all protein-coding genes
+	genes, all_fc = load_fc_table(file_input_gene_fc)
+	list_subsets = []
+	for file_input_subset_gene_list, file_output_pdf, subset_gene_name, c in read_manifest(file_input_manifest):
+		subset_genes = read_subset_file_to_set(file_input_subset_gene_list)
+		list_subsets.append((file_input_subset_gene_list, subset_genes, file_output_pdf, subset_gene_name, c))
+	compare_subsets(genes, all_fc, list_subsets, file_output_summary, processes, n_permutations, ks, seed, max_points, tables)
+
+
+def compare_subsets(genes, all_fc, list_subsets, file_output_summary, processes=1, n_permutations=0, ks=False, seed=0,
+	max_points=0, tables=False):
+	# t-test every subset against all protein-coding genes, render the ecdfs in a process pool and write a summary
+	# table of the size and p-values of each subset. list_subsets contains (source of the subset, set of gene
+	# symbols, file_output_pdf, subset_gene_name, color) for each subset
+	background = permutation_background(all_fc)
+	cache = {}  # permutation null distributions by subset size
+
+	tasks, rows = [], []
+	for subset_source, subset_genes, file_output_pdf, subset_gene_name, c in list_subsets:
+		subset_fc = select_subset_fc(genes, all_fc, subset_genes)
+		t, p = perform_t_test(subset_gene_name, subset_fc, all_fc)
+		file_output_table = os.path.splitext(file_output_pdf)[0] + '_ecdf.tsv' if tables else None
+		tasks.append((file_output_pdf, subset_fc, c, subset_gene_name, max_points, file_output_table))
+		row = [subset_gene_name, subset_source, file_output_pdf, len(subset_fc), len(all_fc), t, p]
+		if n_permutations:
+			result = perform_permutation_test(subset_gene_name, subset_fc, background, n_permutations, ks, seed, cache)
+			row.append(result['permutation_p'])
+			if ks:
+				row.extend([result['ks_statistic'], result['ks_p']])
+		rows.append(row)
+
+	if processes > 1:
+		with ProcessPoolExecutor(max_workers=processes, initializer=set_background_fc, initargs=(all_fc,)) as executor:
+			list(executor.map(render_subset_ecdf, tasks))
+	else:
+		set_background_fc(all_fc)
+		for task in tasks:
+			render_subset_ecdf(task)
+
+	header = ['subset_gene_name', 'subset_gene_list', 'output_pdf', 'n_subset_genes', 'n_protein_coding_genes',
+		't_statistic', 'p_value']
+	if n_permutations:
+		header.append('permutation_p_value')
+		if ks:
+			header.extend(['ks_statistic', 'ks_permutation_p_value'])
+	with open(file_output_summary, 'w') as f:
+		f.write('\t'.join(header) + '\n')
+		for row in rows:
+			f.write('\t'.join([str(item) for item in row]) + '\n')
 
 
 def main():
-	c = 'g'
+	# batch mode: file_input_gene_fc followed by batch=file_input_manifest and other command=value arguments
+	if len(sys.argv) > 2 and sys.argv[2].startswith('batch='):
+		options = get_optional_arguments(sys.argv[2:])
+		if options['summary'] is None:
+			options['summary'] = os.path.splitext(options['batch'])[0] + '_summary.tsv'
+		run_batch(sys.argv[1], options['batch'], options['summary'], int(options['processes']),
+			int(options['permutations']), options['ks'] == 'yes', int(options['seed']), int(options['max_points']),
+			options['tables'] == 'yes')
+		return
 
 	# read in arguments
 	file_input_gene_fc = sys.argv[1]
 	file_input_subset_gene_list = sys.argv[2]
 	file_output_pdf = sys.argv[3]
 	subset_gene_name = sys.argv[4]
-	if len(sys.argv) > 5:
-		c = get_optional_arguments(sys.argv[5:])
+	options = get_optional_arguments(sys.argv[5:])
+	c = options['color']
 
 	# generate list of fc for subset of genes and all protein-coding genes
 	list_subset_fc, list_all_fc = make_fc_lists(file_input_gene_fc, file_input_subset_gene_list)
 
 	# make ecdf and calculate p-value for the mean log2 FC in gene expression levels of 
 	# subset of genes compared to all genes
-	output = make_ecdf(file_output_pdf, (list_subset_fc, c), (list_all_fc, 'k'))
+	output = make_ecdf(file_output_pdf, (list_subset_fc, c, subset_gene_name), (list_all_fc, 'k', 'all protein-coding genes'),
+		max_points=int(options['max_points']), file_output_table=options['table'])
 	perform_t_test(subset_gene_name, list_subset_fc, list_all_fc)
+	if int(options['permutations']):
+		perform_permutation_test(subset_gene_name, list_subset_fc, permutation_background(list_all_fc),
+			int(options['permutations']), options['ks'] == 'yes', int(options['seed']))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+"""
+Title:		LoopIndex.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Loop storage indexed by both anchors. Every HiChIP loop (chr1 start1 stop1 chr2 start2 stop2 ...) is stored once and its
+row number is filed under the (chromosome, bucket) of each of its two contact bins, so a feature finds the loops anchored
+in it from either side: intra-chromosomal loops through both bins on the same chromosome, and inter-chromosomal (trans)
+loops through the bin on the feature's chromosome, without copying the loop into a second chromosome list. Lookups only
+visit the buckets spanned by the feature instead of every loop of the chromosome. Cis-only analyses can drop trans loops
+while the index is built. Scripts that only scan the loops (MasterConnections.py, Deg1LoopChecker.py,
+PermutationNull.py) dedup and filter them with uniqueLoops without building the buckets, and chromosomeRows lists every
+loop under the chromosomes of both of its bins.
+"""
+
+BUCKET_SIZE = 100000  # width in bp of the genomic buckets the contact bins are filed under
+
+
+def isTrans(line):
+	'''
+	Returns whether a loop connects two different chromosomes.
+
+	@line 	loop in list format (chr1 start1 stop1 chr2 start2 stop2 ...)
+	@return 	boolean
+	'''
+	return(line[0] != line[3])
+
+
+def uniqueLoops(lines, cis_only=False):
+	'''
+	Returns the loops with identical lines stored once, in the order they are read, without indexing them. Scripts
+	that scan the loops per chromosome only need these rows (see chromosomeRows).
+
+	@lines 	iterable of loops in list format with integer bin coordinates
+	@cis_only 	whether inter-chromosomal loops are dropped
+	@return 	list of the unique loops
+	'''
+	rows, seen = [], set()
+	for line in lines:
+		key = tuple(line)
+		if key in seen or (cis_only and isTrans(line)):
+			continue
+		seen.add(key)
+		rows.append(line)
+	return(rows)
+
+
+def buildLoopIndex(lines, cis_only=False, bucket_size=BUCKET_SIZE):
+	'''
+	Stores the loops and files every loop under the buckets of both of its contact bins. Identical lines are stored once.
+
+	@lines 	iterable of loops in list format with integer bin coordinates
+	@cis_only 	whether inter-chromosomal loops are dropped
+	@bucket_size 	width of the buckets in bp
+	@return 	dictionary with the loop 'rows', the 'buckets' dictionary of (chrom, bucket) -> list of row numbers, the
+				set of 'chroms' with at least one contact bin, the 'bucket_size' and the number of 'trans' loops stored
+	'''
+	rows, buckets, trans = uniqueLoops(lines, cis_only), {}, 0
+	for row, line in enumerate(rows):
+		trans += isTrans(line)
+		for chrom, start, stop in ((line[0], line[1], line[2]), (line[3], line[4], line[5])):
+			for bucket in range(start // bucket_size, stop // bucket_size + 1):
+				entries = buckets.setdefault((chrom, bucket), [])
+				if not entries or entries[-1] != row:  # both bins of a short cis loop can share a bucket
+					entries.append(row)
+	return({'rows': rows, 'buckets': buckets, 'chroms': set([chrom for chrom, bucket in buckets]),
+		'bucket_size': bucket_size, 'trans': trans})
+
+
+def anchoredRows(index, chrom, start, stop):
+	'''
+	Returns the row numbers of the loops with a contact bin on chrom overlapping [start, stop] (inclusive, as the bin
+	checks of AnchorLoops.py), in the order the loops were stored.
+
+	@index 	dictionary returned by buildLoopIndex
+	@chrom 	chromosome of the feature
+	@start 	start of the feature
+	@stop 	stop of the feature
+	@return 	sorted list of row numbers
+	'''
+	rows, bucket_size = index['rows'], index['bucket_size']
+	found = set()
+	for bucket in range(start // bucket_size, stop // bucket_size + 1):
+		for row in index['buckets'].get((chrom, bucket), []):
+			if row in found:
+				continue
+			line = rows[row]
+			if (line[0] == chrom and start <= line[2] and stop >= line[1]) or \
+				(line[3] == chrom and start <= line[5] and stop >= line[4]):
+				found.add(row)
+	return(sorted(found))
+
+
+def chromosomeRows(rows):
+	'''
+	Returns a chr dictionary of loops in which every loop is listed under the chromosome of each of its contact bins
+	(once for intra-chromosomal loops). The lists share the loop objects, so a trans loop is not copied.
+
+	@rows 	list of loops returned by uniqueLoops (or the 'rows' of buildLoopIndex)
+	@return 	dictionary with chrom as key and the list of the loops with a contact bin on it as value
+	'''
+	dictionary = {}
+	for line in rows:
+		dictionary.setdefault(line[0], []).append(line)
+		if isTrans(line):
+			dictionary.setdefault(line[3], []).append(line)
+	return(dictionary)
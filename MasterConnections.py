@@ -25,51 +25,58 @@ The output is a file containing info about the elements involved in these connec
 @deg2_output_file	pathway to output file for deg2 connections (target loops to the TSS via the intermediate secondary or tertiary regulatory element of interest)
 @deg3_output_file	pathway to output file for deg3 connections (target loops to the TSS by 2 intermeidate regulatory elements of interest)
 @promoter_dist	set integer distance for the TSS (TSS = gene start =/- promoter_dist)
+
+Optional arguments are given as command=value after the positional arguments:
+@engine	'loops' (default) to scan the loops directly or 'sparse' to compute the connections with the sparse matrix engine
+		in SparseConnections.py (requires numpy and scipy); the sparse engine writes the connected TSSs of each degree to
+		the output files rather than every connecting loop
+@mode	'genome' (default) to load every input at once or 'chromosome' to load and analyze one chromosome at a time,
+		appending each chromosome's results to the output files; the inputs are indexed by chromosome with a single pass
+		so they do not need to be sorted or split beforehand
+@database	path to a SQLite database to which the deg0-deg3 results are also written as typed tables indexed by chromosome,
+		gene and anchor (see ResultDatabase.py)
+@processes	number of processes used to parse the seven input files concurrently and to run the permutations (default 1)
+@permutations	number of shuffled target sets of the genomic permutation null (default 0, no permutations); the target peaks
+		are shuffled within their chromosomes keeping their widths, the 0°-3° gene counts are recounted for every
+		shuffled set and the empirical enrichment p-values are printed (see PermutationNull.py, requires numpy and scipy)
+@seed	random seed of the permutations and the preview sample (default 0)
+@loops	HiChIP file given to AnchorLoops.py, from which the loops anchored in the shuffled peaks are taken; defaults to
+		the loops of the three HiChIP input files
+@genome	chromosome sizes file within which the peaks are shuffled; defaults to the extent of the inputs
+@blacklist	bed file of regions in which no shuffled peak is placed
+@null_output	path to a tab delimited file to which the permutation results are also written
+@scores	path to a tab delimited table of the loop strength scores of every connected gene: the number of paths and the
+		summed, max and min strength of its paths per degree, where the strength of a path is the count of its weakest
+		loop, and its strongest chain (loop engine only)
+@preview	number of genes or chromosomes to sample for a quick preview run (default 0, no preview); the sample goes
+		through the usual analysis and outputs, and the number of genes with each degree of connection is scaled up to
+		all genes with a 95% confidence interval (see Preview.py)
+@preview_unit	'genes' (default) for a reservoir sample of gene names or 'chromosomes' for a random sample of chromosomes,
+		of which only the input lines are parsed; the sample is determined by seed
+@checkpoint	work directory in which the parsed inputs, deg1 tables, deg2 chains and final degrees are checkpointed (per
+		chromosome in chromosome mode, see Checkpoint.py); a rerun with the same arguments resumes from the completed
+		stages instead of starting over
+@cis_only	'yes' to drop inter-chromosomal loops from the HiChIP files (and the loops file) while they are read; by default
+		an inter-chromosomal loop connects the features in its two contact bins, each on the chromosome of its bin (see
+		LoopIndex.py). Chromosome mode only loads one chromosome at a time and always drops them
+@profile	path to which a low overhead sampling profile of the run is written: speedscope JSON if it ends with .json,
+		else collapsed stacks for flamegraph.pl; the stacks are rooted at the inputs, deg1, deg2, deg3 and output
+		stages (within each chromosome in chromosome mode) and the time of the stages is printed (see Profiler.py)
 """
 
+import os
 import sys
 import timeit
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import Checkpoint
+import LoopIndex
+import Profiler
+import SortedOutput
 
-HiChIP_target_file = sys.argv[1] # loops targeted in the regulatory element of interest
-HiChIP_element1_file = sys.argv[2]
-HiChIP_element2_file = sys.argv[3]
-target_file = sys.argv[4] # the element whose connection with the gene TSS is being analyzed
-target_name = sys.argv[5]
-gene_file = sys.argv[6]  # code writen for the gene to be the gene!
-gene_name = sys.argv[7]
-element1_file = sys.argv[8]  # other element that can act as a connection point between target and TSS
-element1_name = sys.argv[9]
-element2_file = sys.argv[10]  # other element that can act as a connection point between target and TSS
-element2_name = sys.argv[11]
-deg0_output_file = sys.argv[12]
-deg1_output_file = sys.argv[13]
-deg2_output_file = sys.argv[14]
-deg3_output_file = sys.argv[15]
-promoter_dist = int(sys.argv[16])
-
-start_time = timeit.default_timer()
-HiChIP_target = {}
-HiChIP_element1 = {}
-HiChIP_element2 = {}
-target_loop_dict = {}
-target_dict = {}
-gene = {}
-element1 = {}
-element2 = {}
-unpack = [(target_file, target_dict, target_name), (element1_file, element1, element1_name), (element2_file, element2, element2_name)]
-unpack2 = [(HiChIP_target_file, HiChIP_target), (HiChIP_element1_file, HiChIP_element1), (HiChIP_element2_file, HiChIP_element2)]
-deg1 = {}
-deg2 = {}
-deg3 = {}
-g_e1 = {}
-g_e2 = {}
-target_deg1_list = set()
-e1_deg1_list = set()
-e2_deg1_list = set()
-g_e1_e2 = {}
-g_e2_e1 = {}
-g_e1_e1 = {}
-g_e2_e2 = {}
+# degree, columns of the loop counts and columns of the gene, elements and target of the chains in the output entries
+SCORE_LAYOUTS = [('deg1', [6], [4, 13]), ('deg2', [6, 15], [4, 13, 22]), ('deg3', [6, 15, 24], [4, 13, 22, 31])]
+SCORE_COLUMNS = {key: (count_columns, chain_columns) for key, count_columns, chain_columns in SCORE_LAYOUTS}
 
 def write2dict(key, value, dictionary):
 # writes only unique entries to a dictionary in which the value is a set to which the entry is appended
@@ -80,13 +87,22 @@ def write2dict(key, value, dictionary):
 		dictionary[key] = [value]
 	return(dictionary)
 
-def OrderChrDict(chr_dict):  # orders keys in dictionary and sorts values by second component of values
-	from collections import OrderedDict
+def appendNew(key, value, dictionary):
+# appends an entry to the value list of key as write2dict does; returns whether the entry was new, so a path found
+# twice is only scored once
+	entries = dictionary.setdefault(key, [])
+	if value in entries:
+		return(False)
+	entries.append(value)
+	return(True)
 
-	for key, value in chr_dict.items():  # sort values for each key
-		chr_dict[key] = sorted(value, key=lambda element: (element[1], element[2]))
-	final_dict = OrderedDict(sorted(chr_dict.items(), key=lambda t: t[0]))  # sort keys and write sorted info to an Ordered Dict
-	return(final_dict)
+def uniqueChrDict(entries):
+# writes (chrom, entry) pairs to a chr dictionary keeping the first occurrence of every unique entry in order; a dict per
+# chromosome makes each duplicate check O(1) instead of the scan of the value list in write2dict
+	dictionary = {}
+	for chrom, entry in entries:
+		dictionary.setdefault(chrom, {}).setdefault(tuple(entry), entry)
+	return({chrom: list(value.values()) for chrom, value in dictionary.items()})
 
 def CheckBin(val, Bin):  # checks if a given value falls within a bin (bin = [start, stop])
 	start, stop = int(Bin[0]), int(Bin[1])
@@ -113,19 +129,21 @@ def BinChecker(feature_start, feature_stop, bin_coordinates):
 		return(False)
 
 def DistalConnectCheck(feature, anchor, loop):
-# identifies which end of the loop the anchor is associated and checks if the feature is on the other end of the loop
-	feature_start, feature_stop = int(feature[0]), int(feature[1])
-	anchor_start, anchor_stop = int(anchor[0]), int(anchor[1])
+# identifies which end of the loop the anchor is associated and checks if the feature is on the other end of the loop;
+# feature and anchor are [chrom, start, stop] and a contact bin only holds a feature on the bin's own chromosome, so
+# inter-chromosomal loops connect features on their two chromosomes
+	feature_chrom, feature_start, feature_stop = feature[0], int(feature[1]), int(feature[2])
+	anchor_chrom, anchor_start, anchor_stop = anchor[0], int(anchor[1]), int(anchor[2])
 	loop1 = [int(loop[1]), int(loop[2])]
 	loop2 = [int(loop[4]), int(loop[5])]
 
-	check = BinChecker(anchor_start, anchor_stop, loop1)
+	check = anchor_chrom == loop[0] and BinChecker(anchor_start, anchor_stop, loop1)
 	if check:
-		isin0 = BinChecker(feature_start, feature_stop, loop2)
+		isin0 = feature_chrom == loop[3] and BinChecker(feature_start, feature_stop, loop2)
 		if isin0:
 			return('yes')
-	else:  # anchor is in bin 2 and check if feature is in bin 1
-		isin1 = BinChecker(feature_start, feature_stop, loop1)
+	elif anchor_chrom == loop[3]:  # anchor is in bin 2 and check if feature is in bin 1
+		isin1 = feature_chrom == loop[0] and BinChecker(feature_start, feature_stop, loop1)
 		if isin1:  # write lines of HiChIP files to dictionary if they are anchored at one end with the feature of interest
 			return('yes')
 	return(False)
@@ -142,7 +160,7 @@ def countUniqueGene(dictionary):
 
 def getTSS(gene_dict, promoter_dist):  # establish coordinates for TSS based on gene coordinates
 	# outputs the TSS as a given distance upstream and downstream of the gene start in a chr dictionary
-	TSS = {}
+	entries = []
 	for chrom, value in gene_dict.items():
 		for line in value:
 			if line[5] == '+':
@@ -151,11 +169,11 @@ def getTSS(gene_dict, promoter_dist):  # establish coordinates for TSS based on
 				line[2], line[3] = (int(line[3]) - promoter_dist), (int(line[3]) + promoter_dist)
 			else:
 				print('Error: incorrect formatting in gene input file!')
-			TSS = write2dict(chrom, line[:5], TSS)
-	return(TSS)
+			entries.append((chrom, line[:5]))
+	return(uniqueChrDict(entries))
 
 
-def deg0_analysis(TSS_dict, target_dict):  # find overlap between TSSs and target coordinates; verified by bedtools intersect
+def deg0_analysis(TSS_dict, target_dict, scores=None):  # find overlap between TSSs and target coordinates; verified by bedtools intersect
 	deg0 = {}
 	for chrom, value0 in TSS_dict.items():
 		if chrom in target_dict:
@@ -167,67 +185,70 @@ def deg0_analysis(TSS_dict, target_dict):  # find overlap between TSSs and targe
 					if check:
 						keep = item0[:]
 						keep.extend(item1)
-						deg0 = write2dict(chrom, keep, deg0)
+						if appendNew(chrom, keep, deg0) and scores is not None:
+							scorePath(scores, 'deg0', keep)
 	return(deg0)
 
 
-def deg1_analysis(entry, TSS):
-	HiChIP_dict, output_dict, output_list, name = entry[0], entry[1], entry[2], entry[3]
+def deg1_analysis(entry, TSS, scores=None):
+	HiChIP_dict, output_dict, output_list = entry[0], entry[1], entry[2]
 	for chrom, value in HiChIP_dict.items():
 		if chrom in TSS:
 			for item in value:
 				loop = item[:6]
-				target = [int(item[11]), int(item[12])]
+				target = item[10:13]
 				for line in TSS[chrom]:
-					feature = [line[2], line[3]]
+					feature = line[1:4]
 					check = DistalConnectCheck(feature, target, loop)
 					if check:
 						keep = line[:]
 						keep.append('loop_count')
 						keep.extend(item[6:14])
-						output_dict = write2dict(chrom, keep, output_dict)
+						if appendNew(chrom, keep, output_dict) and scores is not None:
+							scorePath(scores, 'deg1', keep)
 						output_list.add(tuple(item[9:14]))
-	count = countUniqueGene(output_dict)
-	print('# Number of', gene_name, 'Directly Looped to', name, '(i.e. 1°', name, ') =', count)
 	return(output_dict, output_list)
 
 
-def deg2_analysis(entry, TSS):
-	HiChIP_dict, element, deg1_dict, g_e_deg1 = entry[0], entry[1], entry[2], entry[3]
-	deg2_dict, e1_name, e2_name = entry[4], entry[5], entry[6]
+def deg2_analysis(entry, TSS, scores=None):
+	HiChIP_dict, element, deg1_dict, g_e_deg1, deg2_dict = entry[0], entry[1], entry[2], entry[3], entry[4]
+	deg1_element = {}  # 1° connections by the element they reach, which may be on another chromosome than the TSS
+	for value in deg1_dict.values():
+		for i in value:
+			deg1_element.setdefault(tuple(i[10:13]), []).append(i)
 	for chrom, value in HiChIP_dict.items():
 		if chrom in element:
 			for item in value:
 				if tuple(item[9:14]) in g_e_deg1:  # only proceed with cohesin loops targeted in third elements connected with a TSS
 					loop = item[:6]
-					target = [int(item[11]), int(item[12])]
+					target = item[10:13]
 					for line in element[chrom]:
-						feature = [line[2], line[3]]
+						feature = line[1:4]
 						check0 = DistalConnectCheck(feature, target, loop)
 						if check0:
-							for i in deg1_dict[chrom]:
-								if item[10:13] == i[10:13]:
-									keep = i[:]
-									keep.append('loop_count')
-									keep.extend(item[6:9])
-									keep.extend(line)
-									deg2_dict = write2dict(chrom, keep, deg2_dict)
+							for i in deg1_element.get(tuple(item[10:13]), []):
+								keep = i[:]
+								keep.append('loop_count')
+								keep.extend(item[6:9])
+								keep.extend(line)
+								if appendNew(i[1], keep, deg2_dict) and scores is not None:  # keyed by the chromosome of the TSS
+									scorePath(scores, 'deg2', keep)
 	return(deg2_dict)
 
 
-def deg3_analysis(entry, HiChIP_target, deg3):
+def deg3_analysis(entry, HiChIP_target, deg3, scores=None):
 	for chrom, value in entry.items():
-		if chrom in target_dict:
-			for item in value:
-				e0 = [item[1], item[2], item[3]]
-				e1 = [item[10], item[11], item[12]]
-				e2 = [item[19], item[20], item[21]]
-				confirmation = determineConfirmation(e0, e1, e2, HiChIP_target)
-				if confirmation:
-					keep = item[:]
-					keep.append('loop_count')
-					keep.extend(confirmation)
-					deg3 = write2dict(chrom, keep, deg3)
+		for item in value:
+			e0 = [item[1], item[2], item[3]]
+			e1 = [item[10], item[11], item[12]]
+			e2 = [item[19], item[20], item[21]]
+			confirmation = determineConfirmation(e0, e1, e2, HiChIP_target)
+			if confirmation:
+				keep = item[:]
+				keep.append('loop_count')
+				keep.extend(confirmation)
+				if appendNew(chrom, keep, deg3) and scores is not None:
+					scorePath(scores, 'deg3', keep)
 	return(deg3)
 
 
@@ -272,162 +293,658 @@ def removeDuplicates(return_list, *arg_list):
 
 
 def determineConfirmation(e0, e1, e2, HiChIP_e3_dict):
-	chrom = e0[0]
-	e0_start, e0_stop = int(e0[1]), int(e0[2])
-	e1_start, e1_stop = int(e1[1]), int(e1[2])
-	e2_start, e2_stop = int(e2[1]), int(e2[2])
-	e2_e3 = 'no'
-
-	for item in HiChIP_e3_dict[chrom]:
-		loop1 = [int(item[1]), int(item[2])]
-		loop2 = [int(item[4]), int(item[5])]
-		keep = item[6:14]
-		target_start, target_stop = int(item[11]), int(item[12])
-		target_check = BinChecker(target_start, target_stop, loop1)
-		if target_check:
-			check0 = BinChecker(e0_start, e0_stop, loop2)
-			check1 = BinChecker(e1_start, e1_stop, loop2)
-			check2 = BinChecker(e2_start, e2_stop, loop2)
-			if check0 or check1:
-				return(False)
-			if check2:
-				e2_e3 = 'yes'
-		else:  # target is in bin 2 and check if feature is in bin 1
-			check0 = BinChecker(e0_start, e0_stop, loop1)
-			check1 = BinChecker(e1_start, e1_stop, loop1)
-			check2 = BinChecker(e2_start, e2_stop, loop1)
+# checks the target loops with a contact bin on the chromosome of the TSS (e0) or either element (e1, e2): returns False
+# if the far bin of one of them holds e0 or e1, else the loop info of the first one whose far bin holds e2
+	confirmation = False
+	scanned = set()  # a trans loop is listed under both of its chromosomes
+
+	for chrom in dict.fromkeys([e0[0], e1[0], e2[0]]):
+		for item in HiChIP_e3_dict.get(chrom, []):
+			if id(item) in scanned:
+				continue
+			scanned.add(id(item))
+			loop = item[:6]
+			target = item[10:13]
+			check0 = DistalConnectCheck(e0, target, loop)
+			check1 = DistalConnectCheck(e1, target, loop)
+			check2 = DistalConnectCheck(e2, target, loop)
 			if check0 or check1:
 				return(False)
-			if check2:
-				e2_e3 = 'yes'
-	if e2_e3 == 'yes':
-		return(keep)
-	else:
-		return(False)
+			if check2 and not confirmation:  # the loop that confirms the path
+				confirmation = item[6:14]
+	return(confirmation)
+
+def chromosomeIndex(file):
+# returns a dict with chrom as key and a list of the (offset, size) byte ranges holding that chromosome's lines as value
+	index = {}
+	offset = 0
+	with open(file, 'rb') as file:
+		for line in file:
+			chrom = line.split(b'\t', 1)[0].decode()
+			segments = index.setdefault(chrom, [])
+			if segments and sum(segments[-1]) == offset:  # extend the range if the previous line was the same chromosome
+				segments[-1] = (segments[-1][0], segments[-1][1] + len(line))
+			else:
+				segments.append((offset, len(line)))
+			offset += len(line)
+	return(index)
+
 
-with open(gene_file, 'r') as file:
-	gene = {}
-	for line in file:
+def fileLines(file, segments=None):
+# yields the lines of a file; only the lines in the (offset, size) byte ranges of segments if given
+	if segments is None:
+		with open(file, 'r') as file:
+			for line in file:
+				yield line
+	else:
+		with open(file, 'rb') as file:
+			for offset, size in segments:
+				file.seek(offset)
+				for line in file.read(size).decode().split('\n'):
+					if line:
+						yield line
+
+
+def unpackGeneFile(gene_file, gene_name, segments=None):
+# write gene bed file to a chr dictionary with the gene_name prepended to each line
+	entries = []
+	for line in fileLines(gene_file, segments):
 		line = line.rstrip('\r\n').split('\t')
 		chrom, line[1], line[2] = line[0], int(line[1]), int(line[2])
 		keep = [gene_name]
 		keep.extend(line[:5])
-		gene = write2dict(chrom, keep, gene)
-	file.close()
+		entries.append((chrom, keep))
+	return(uniqueChrDict(entries))
 
-for item in unpack:  # write input files to dictionary with chrom as key and a list of the
-	file, dictionary, name = item[0], item[1], item[2]
-	with open(file, 'r') as file:
-		for line in file:
-			line = line.rstrip('\r\n').split('\t')
-			chrom, line[1], line[2] = line[0], int(line[1]), int(line[2])
-			keep = [name]
-			keep.extend(line[:4])
-			dictionary = write2dict(chrom, keep, dictionary)
-	file.close()
-
-for item in unpack2:  # write input files to dictionary with chrom as key and a list of the
-	file, dictionary = item[0], item[1]
-	with open(file, 'r') as file:
-		for line in file:
-				line = line.rstrip('\r\n').split('\t')
-				chrom, line[1], line[2] = line[0], int(line[1]), int(line[2])
-				dictionary = write2dict(chrom, line, dictionary)
-
-for chrom, value in HiChIP_target.items():  # write coordinates for targets involved in looping to chr dict
-	for item in value:
-		keep = item[10:13]
-		target_loop_dict = write2dict(chrom, keep, target_loop_dict)
-
-TSS = getTSS(gene, promoter_dist)  # establish coordinates for TSS
-
-deg0 = deg0_analysis(TSS, target_dict)  # find overlap between TSSs and target coordinates; verified by bedtools intersect
-count = countUniqueGene(deg0)
-print('# Number of', gene_name, 'Directly Bound to', target_name, '(i.e. 0°', target_name, ') =', count)
-
-# find all TSSs and targets that are directly connected by looping - store info in chr dict and a list containing target info
-deg1_analysis_list = [[HiChIP_target, deg1, target_deg1_list, target_name], \
-[HiChIP_element1, g_e1, e1_deg1_list, element1_name], [HiChIP_element2, g_e2, e2_deg1_list, element2_name]]
-for entry in deg1_analysis_list:
-	entry[1], entry[2] = deg1_analysis(entry, TSS)
-
-# identifies TSSs and targets connected by looping via a third element and stores info in chr dict
-deg2_analysis_list = [[HiChIP_element1, target_dict, g_e1, e1_deg1_list, deg2, element1_name, target_name], \
-[HiChIP_element2, target_dict, g_e2, e2_deg1_list, deg2, element2_name, target_name], \
-[HiChIP_element1, element2, g_e1, e1_deg1_list, g_e1_e2, element1_name, element2_name], \
-[HiChIP_element2, element1, g_e2, e2_deg1_list, g_e2_e1, element2_name, element1_name], \
-[HiChIP_element1, element1, g_e1, e1_deg1_list, g_e1_e1, element1_name, element1_name], \
-[HiChIP_element2, element2, g_e2, e2_deg1_list, g_e2_e2, element2_name, element2_name]]
-for entry in deg2_analysis_list:
-	entry[4] = deg2_analysis(entry, TSS)
-count = countUniqueGene(deg2)
-print('# Number of', gene_name, 'Looped to', target_name, 'via', element1_name, 'or', element2_name, '(i.e. 2°', target_name, ') =', count)
-
-# identifies TSSs and targets connected by looping via a third and fourth element and stores info in chr dict
-deg3_analysis_list = [g_e1_e2, g_e2_e1, g_e1_e1, g_e2_e2]
-for entry in deg3_analysis_list:
-	deg3 = deg3_analysis(entry, HiChIP_target, deg3)
-count = countUniqueGene(deg3)
-print('# Number of', gene_name, 'with 3° connection with', target_name, 'via', element1_name, 'and', element2_name, '=', count)
-
-unique_genes = uniqueGeneDict(deg0, deg1, deg2, deg3)  # store all genes whose TSS is connected to achor in some way in chr dict
-
-deg0_deg1 = commonGenes(deg0, deg1)  # find genes whose connected to the anchor via multiple methods
-deg0_deg2 = commonGenes(deg0, deg2)
-deg0_deg3 = commonGenes(deg0, deg3)
-deg1_deg2 = commonGenes(deg1, deg2)
-deg1_deg3 = commonGenes(deg1, deg3)
-deg2_deg3 = commonGenes(deg2, deg3)
-deg0_deg1_deg2 = commonEntries(deg0_deg1, deg0_deg2)
-deg0_deg2_deg3 = commonEntries(deg0_deg2, deg0_deg3)
-deg0_deg1_deg3 = commonEntries(deg0_deg1, deg0_deg3)
-deg1_deg2_deg3 = commonEntries(deg1_deg2, deg1_deg3)
-deg0_deg1_deg2_deg3 = commonEntries(deg0_deg1_deg2, deg1_deg2_deg3)
-
-deg0_deg1_deg2 = removeDuplicates(deg0_deg1_deg2, deg0_deg1_deg2_deg3)  # eliminate duplicates between multiple confirmation lists
-deg0_deg2_deg3 = removeDuplicates(deg0_deg2_deg3, deg0_deg1_deg2_deg3)
-deg0_deg1_deg3 = removeDuplicates(deg0_deg1_deg3, deg0_deg1_deg2_deg3)
-deg1_deg2_deg3 = removeDuplicates(deg1_deg2_deg3, deg0_deg1_deg2_deg3)
-deg0_deg1 = removeDuplicates(deg0_deg1, deg0_deg1_deg2, deg0_deg1_deg3, deg0_deg1_deg2_deg3)
-deg0_deg2 = removeDuplicates(deg0_deg2, deg0_deg2_deg3, deg0_deg1_deg2, deg0_deg1_deg2_deg3)
-deg0_deg3 = removeDuplicates(deg0_deg3, deg0_deg1_deg3, deg0_deg2_deg3, deg0_deg1_deg2_deg3)
-deg1_deg2 = removeDuplicates(deg1_deg2, deg1_deg2_deg3, deg0_deg1_deg2, deg0_deg1_deg2_deg3)
-deg1_deg3 = removeDuplicates(deg1_deg3, deg1_deg2_deg3, deg0_deg1_deg3, deg0_deg1_deg2_deg3)
-deg2_deg3 = removeDuplicates(deg2_deg3, deg1_deg2_deg3, deg0_deg2_deg3, deg0_deg1_deg2_deg3)
-
-count = countUniqueGene(unique_genes)
-print('# Final Unique Counts for 0°, 1°, 2° and 3° connections between', gene_name, 'and', target_name, '=', count)
-print('# Number of', gene_name, 'with 0° and 1° connections with', target_name, '=', len(deg0_deg1))
-print('# Number of', gene_name, 'with 0° and 2° connections with', target_name, '=', len(deg0_deg2))
-print('# Number of', gene_name, 'with 0° and 3° connections with', target_name, '=', len(deg0_deg3))
-print('# Number of', gene_name, 'with 1° and 2° connections with', target_name, '=', len(deg1_deg2))
-print('# Number of', gene_name, 'with 1° and 3° connections with', target_name, '=', len(deg1_deg3))
-print('# Number of', gene_name, 'with 2° and 3° connections with', target_name, '=', len(deg2_deg3))
-print('# Number of', gene_name, 'with 0°, 1°, and 2° connections with', target_name, '=', len(deg0_deg1_deg2))
-print('# Number of', gene_name, 'with 0°, 1°, and 3° connections with', target_name, '=', len(deg0_deg1_deg3))
-print('# Number of', gene_name, 'with 0°, 2°, and 3° connections with', target_name, '=', len(deg0_deg2_deg3))
-print('# Number of', gene_name, 'with 1°, 2°, and 3° connections with', target_name, '=', len(deg1_deg2_deg3))
-print('# Number of', gene_name, 'with 0°, 1°, 2°, and 3° connections with', target_name, '=', len(deg0_deg1_deg2_deg3))
-count = sum([len(deg0_deg1), len(deg0_deg2), len(deg0_deg3), len(deg1_deg2), len(deg1_deg3), len(deg2_deg3),\
- len(deg0_deg1_deg2), len(deg0_deg1_deg3), len(deg0_deg2_deg3), len(deg1_deg2_deg3),len(deg0_deg1_deg2_deg3)])
-print('# Number of', gene_name, 'with mutiple mixed connections (0°, 1°, 2°, and/or 3°) with', target_name, '=', count)
-
-deg0_sort = OrderChrDict(deg0)  # order output dicts
-deg1_sort = OrderChrDict(deg1)
-deg2_sort = OrderChrDict(deg2)
-deg3_sort = OrderChrDict(deg3)
-
-output_dicts = [(deg0_output_file, deg0_sort), (deg1_output_file, deg1_sort),\
-(deg2_output_file, deg2_sort), (deg3_output_file, deg3_sort)]
-
-for item in output_dicts:
-	file, dictionary = item[0], item[1]
+
+def unpackBedFile(file, name, segments=None):
+# write bed file to a chr dictionary with the element name prepended to the chrom, start, stop and ID of each line
+	entries = []
+	for line in fileLines(file, segments):
+		line = line.rstrip('\r\n').split('\t')
+		chrom, line[1], line[2] = line[0], int(line[1]), int(line[2])
+		keep = [name]
+		keep.extend(line[:4])
+		entries.append((chrom, keep))
+	return(uniqueChrDict(entries))
+
+
+def unpackHiChIPFile(file, segments=None, cis_only=False):
+# write HiChIP file generated by AnchorLoops.py to a chr dictionary with the entire line as the value; the unique lines
+# are kept once (see LoopIndex.uniqueLoops) and every line is listed under the chromosomes of both of its contact
+# bins, so inter-chromosomal loops reach features on either chromosome. They are dropped if cis_only
+	lines = []
+	for line in fileLines(file, segments):
+		line = line.rstrip('\r\n').split('\t')
+		line[1], line[2], line[4], line[5] = int(line[1]), int(line[2]), int(line[4]), int(line[5])
+		lines.append(line)
+	return(LoopIndex.chromosomeRows(LoopIndex.uniqueLoops(lines, cis_only)))
+
+
+def intArray(values):
+# packs integers to an array of the smallest item size that holds them
+	low, high = min(values, default=0), max(values, default=0)
+	if low >= 0 and high < 2 ** 8:
+		return(array('B', values))
+	if low >= 0 and high < 2 ** 16:
+		return(array('H', values))
+	if -2 ** 31 <= low and high < 2 ** 31:
+		return(array('i', values))
+	return(array('q', values))
+
+
+def compactColumn(column):
+# packs one column of a table: integers to an array, strings with few distinct values (chromosomes, names, fdr) to an
+# array of codes into the tuple of values, other strings to a single tab-joined string
+	if all(type(item) is int for item in column):
+		return(('int', intArray(column)))
+	if not all(type(item) is str and '\t' not in item for item in column):
+		return(('list', list(column)))
+	codes = {}
+	for item in column:
+		if item not in codes:
+			codes[item] = len(codes)
+			if len(codes) > len(column) // 2:  # mostly distinct values
+				return(('joined', '\t'.join(column)))
+	return(('codes', tuple(codes), intArray([codes[item] for item in column])))
+
+
+def expandColumn(column):
+# unpacks a column packed by compactColumn to a list
+	if column[0] == 'int':
+		return(column[1].tolist())
+	if column[0] == 'joined':
+		return(column[1].split('\t'))
+	if column[0] == 'codes':
+		values = column[1]
+		return([values[code] for code in column[2]])
+	return(column[1])
+
+
+def compactChrDict(dictionary):
+# packs a chr dictionary of lists into a compact table to send between processes: every distinct entry is stored once
+# as a row, the columns of the rows are packed by compactColumn and each chromosome is an array of row numbers, so
+# pickling costs about the size of the distinct data instead of one object per field
+	rows, row_ids, chroms = [], {}, {}
+	for chrom, value in dictionary.items():
+		ids = array('q')
+		for entry in value:
+			if id(entry) not in row_ids:  # an entry listed under several chromosomes is stored once
+				row_ids[id(entry)] = len(rows)
+				rows.append(entry)
+			ids.append(row_ids[id(entry)])
+		chroms[chrom] = ids
+	columns = None
+	if rows and len(set([len(entry) for entry in rows])) == 1:  # columns need rows of equal length
+		columns = [compactColumn(column) for column in zip(*rows)]
+	return({'rows': rows if columns is None else len(rows), 'columns': columns, 'chroms': chroms})
+
+
+def expandChrDict(compact):
+# unpacks a table made by compactChrDict to the chr dictionary of lists
+	if compact['columns'] is None:
+		rows = compact['rows']
+	else:
+		rows = [list(entry) for entry in zip(*[expandColumn(column) for column in compact['columns']])]
+	return({chrom: [rows[i] for i in ids] for chrom, ids in compact['chroms'].items()})
+
+
+def compactParse(function, *args):
+# runs a parse function in a worker process and returns its chr dictionary packed by compactChrDict
+	return(compactChrDict(function(*args)))
+
+
+def loadInputs(files, names, promoter_dist, segments=None, executor=None, cis_only=False):
+# parse all input files (only the byte ranges in segments for the files given in it) to chr dicts; TSSs are established
+# from the gene file. files and segments are dicts keyed by 'HiChIP_target', 'HiChIP_element1', 'HiChIP_element2',
+# 'target', 'gene', 'element1' and 'element2'. The files are parsed concurrently if a process pool executor is given
+# and inter-chromosomal loops are dropped from the HiChIP files if cis_only. The workers return compact tables (see
+# compactChrDict) that are unpacked here
+	if segments is None:
+		segments = {}
+	gene_name, target_name, element1_name, element2_name = names
+	tasks = {'gene': (unpackGeneFile, files['gene'], gene_name, segments.get('gene'))}
+	for key, name in (('target', target_name), ('element1', element1_name), ('element2', element2_name)):
+		tasks[key] = (unpackBedFile, files[key], name, segments.get(key))
+	for key in ('HiChIP_target', 'HiChIP_element1', 'HiChIP_element2'):
+		tasks[key] = (unpackHiChIPFile, files[key], segments.get(key), cis_only)
+
+	if executor is None:
+		parsed = {key: task[0](*task[1:]) for key, task in tasks.items()}
+	else:  # submit the largest files first so the slowest parse starts right away
+		order = sorted(tasks, key=lambda key: -inputSize(files[key], segments.get(key)))
+		futures = {key: executor.submit(compactParse, *tasks[key]) for key in order}
+		parsed = {key: expandChrDict(future.result()) for key, future in futures.items()}
+	inputs = {'TSS': getTSS(parsed.pop('gene'), promoter_dist)}  # establish coordinates for TSS
+	inputs.update(parsed)
+	return(inputs)
+
+
+def inputSize(file, segments=None):
+# number of bytes of a file to be parsed (only the byte ranges in segments if given)
+	if segments is None:
+		return(os.path.getsize(file))
+	return(sum([size for offset, size in segments]))
+
+
+def deg1Stage(HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS):
+# finds the 0° connections and the 1° connections of the TSSs to the target and to both elements; returns dict of the
+# deg0 and deg1 chr dicts and the lists of loop + anchored element tuples connected to a TSS
+	deg1, g_e1, g_e2 = {}, {}, {}
+	target_deg1_list, e1_deg1_list, e2_deg1_list = set(), set(), set()
+
+	scores = {}  # loop strength scores of the TSSs, reduced while the connections are found
+	deg0 = deg0_analysis(TSS, target_dict, scores)  # find overlap between TSSs and target coordinates; verified by bedtools intersect
+
+	# find all TSSs and targets that are directly connected by looping - store info in chr dict and a list containing target info
+	deg1_analysis_list = [[HiChIP_target, deg1, target_deg1_list], [HiChIP_element1, g_e1, e1_deg1_list], \
+	[HiChIP_element2, g_e2, e2_deg1_list]]
+	for entry in deg1_analysis_list:
+		entry[1], entry[2] = deg1_analysis(entry, TSS, scores if entry[1] is deg1 else None)
+	return({'deg0': deg0, 'deg1': deg1, 'deg1_element1': g_e1, 'deg1_element2': g_e2, 'e1_deg1_list': e1_deg1_list, \
+		'e2_deg1_list': e2_deg1_list, 'scores': scores})
+
+
+def deg2Stage(HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, element2, deg1_stage):
+# identifies TSSs and targets connected by looping via a third element, and the TSS - element - element chains that are
+# checked for 3° connections; returns dict of the deg2 chr dict and the chain chr dicts
+	g_e1, g_e2 = deg1_stage['deg1_element1'], deg1_stage['deg1_element2']
+	e1_deg1_list, e2_deg1_list = deg1_stage['e1_deg1_list'], deg1_stage['e2_deg1_list']
+	deg2 = {}
+	g_e1_e2, g_e2_e1, g_e1_e1, g_e2_e2 = {}, {}, {}, {}
+
+	deg2_analysis_list = [[HiChIP_element1, target_dict, g_e1, e1_deg1_list, deg2], \
+	[HiChIP_element2, target_dict, g_e2, e2_deg1_list, deg2], \
+	[HiChIP_element1, element2, g_e1, e1_deg1_list, g_e1_e2], \
+	[HiChIP_element2, element1, g_e2, e2_deg1_list, g_e2_e1], \
+	[HiChIP_element1, element1, g_e1, e1_deg1_list, g_e1_e1], \
+	[HiChIP_element2, element2, g_e2, e2_deg1_list, g_e2_e2]]
+	scores = {}
+	for entry in deg2_analysis_list:
+		entry[4] = deg2_analysis(entry, TSS, scores if entry[4] is deg2 else None)
+	return({'deg2': deg2, 'chains': [g_e1_e2, g_e2_e1, g_e1_e1, g_e2_e2], 'scores': scores})
+
+
+def deg3Stage(HiChIP_target, deg1_stage, deg2_stage):
+# identifies TSSs and targets connected by looping via a third and fourth element; returns the dict of every degree and
+# the gene scores of all degrees
+	deg3, scores = {}, {}
+	for entry in deg2_stage['chains']:
+		deg3 = deg3_analysis(entry, HiChIP_target, deg3, scores)
+	scores = mergeGeneScores(mergeGeneScores(mergeGeneScores({}, deg1_stage['scores']), deg2_stage['scores']), scores)
+	return({'deg0': deg1_stage['deg0'], 'deg1': deg1_stage['deg1'], 'deg1_element1': deg1_stage['deg1_element1'], \
+		'deg1_element2': deg1_stage['deg1_element2'], 'deg2': deg2_stage['deg2'], 'deg3': deg3, 'scores': scores})
+
+
+def connectionAnalysis(HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, element2, work_dir=None):
+# find 0°, 1°, 2° and 3° connections between TSSs and the target
+# returns dict of the chr dict of each degree ('deg0', 'deg1', 'deg1_element1', 'deg1_element2', 'deg2', 'deg3') and
+# the gene 'scores' (see scorePath)
+# the result of each stage is checkpointed in work_dir if given, and completed stages are loaded instead of recomputed
+	with Profiler.section('deg1'):
+		deg1_stage = Checkpoint.stage(work_dir, 'deg1', deg1Stage, HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS)
+	with Profiler.section('deg2'):
+		deg2_stage = Checkpoint.stage(work_dir, 'deg2', deg2Stage, HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, \
+			element2, deg1_stage)
+	with Profiler.section('deg3'):
+		return(Checkpoint.stage(work_dir, 'degrees', deg3Stage, HiChIP_target, deg1_stage, deg2_stage))
+
+
+def sparseConnectionAnalysis(HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, element2):
+# same connections as connectionAnalysis computed with the sparse matrix engine; the chr dicts contain the connected TSSs only
+	import SparseConnections
+
+	result = SparseConnections.sparseConnections(HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, element2)
+	return({key: SparseConnections.connectedTSSDict(result['TSS'], result[key]) for key in result if key != 'TSS'})
+
+
+def runAnalysis(inputs, engine, work_dir=None):
+# run the connection analysis with the chosen engine on the chr dicts returned by loadInputs, checkpointing its stages
+# in work_dir if given
+	arguments = (inputs['HiChIP_target'], inputs['HiChIP_element1'], inputs['HiChIP_element2'], inputs['target'], \
+		inputs['TSS'], inputs['element1'], inputs['element2'])
+	if engine == 'sparse':
+		with Profiler.section('sparse'):
+			return(Checkpoint.stage(work_dir, 'degrees', sparseConnectionAnalysis, *arguments))
+	return(connectionAnalysis(*arguments, work_dir=work_dir))
+
+
+def resumeAnalysis(files, names, promoter_dist, engine, segments=None, executor=None, work_dir=None, cis_only=False):
+# parses the inputs and runs the connection analysis, checkpointing the parsed inputs and each stage in work_dir if
+# given. Returns the parsed inputs and the degree dicts; the inputs are None when the analysis was already complete
+# in work_dir, as they are then not needed
+	if Checkpoint.done(work_dir, 'degrees'):
+		return(None, Checkpoint.load(work_dir, 'degrees'))
+	with Profiler.section('inputs'):
+		inputs = Checkpoint.stage(work_dir, 'inputs', loadInputs, files, names, promoter_dist, segments, executor, cis_only)
+	return(inputs, runAnalysis(inputs, engine, work_dir))
+
+
+def databaseResults(database, degrees, engine, mode='w'):
+# writes the deg0-deg3 chr dicts to typed and indexed tables of a SQLite database; mode 'a' appends to the tables
+	import ResultDatabase
+
+	for key in ('deg0', 'deg1', 'deg2', 'deg3'):
+		if engine == 'sparse':  # the sparse engine only reports the connected TSSs
+			schema = ResultDatabase.TSS_COLUMNS
+		else:
+			schema = ResultDatabase.MASTER_CONNECTIONS[key]
+		ResultDatabase.writeTable(database, key, degrees[key], schema, mode)
+
+
+def chromosomeAnalysis(files, names, promoter_dist, engine, output_files, database=None, executor=None, work_dir=None, scores=None, \
+	cis_only=False):
+# loads and analyzes one chromosome at a time and appends each chromosome's deg0-deg3 results to the output files, so
+# memory scales with the largest chromosome. Returns the degree dicts reduced to the unique connected TSSs for the summary
+# the stages of each chromosome are checkpointed in a subdirectory of work_dir if given, so completed chromosomes are
+# only written out again on a rerun. The gene scores of each chromosome are merged into scores if a dict is given
+	with Profiler.section('index'):
+		indexes = {key: chromosomeIndex(file) for key, file in files.items()}
+	for file in output_files:  # start from empty output files
+		open(file, 'w').close()
+	degrees = {}
+	for chrom in sorted(indexes['gene'], key=SortedOutput.naturalKey):  # same order as a whole genome run
+		with Profiler.section(chrom):
+			segments = {key: index.get(chrom, []) for key, index in indexes.items()}
+			chrom_dir = os.path.join(work_dir, chrom) if work_dir else None
+			inputs, result = resumeAnalysis(files, names, promoter_dist, engine, segments, executor, chrom_dir, cis_only)
+			with Profiler.section('output'):
+				outputResults(zip(output_files, [result['deg0'], result['deg1'], result['deg2'], result['deg3']]), 'a')
+				if database:  # replace the tables with the first chromosome, then append
+					databaseResults(database, result, engine, 'a' if degrees else 'w')
+			if scores is not None:
+				mergeGeneScores(scores, result['scores'])
+			for key, value in result.items():
+				if key != 'scores':
+					degrees.setdefault(key, {}).update(uniqueGeneDict(value))
+	return(degrees)
+
+
+def previewInputs(files, names, promoter_dist, unit, size, seed=0, executor=None, cis_only=False):
+# parses a deterministic random sample of the inputs for the preview mode: the TSSs of a reservoir sample of size gene
+# names (unit 'genes') or every input line of a random sample of size chromosomes (unit 'chromosomes'). Returns the
+# inputs and a dict of the sampled units with their sizes and the totals needed to scale the counts up
+	import Preview
+
+	if unit == 'chromosomes':  # only the sampled chromosomes are parsed; the gene file is read to size every chromosome
+		indexes = {key: chromosomeIndex(file) for key, file in files.items()}
+		genes = unpackGeneFile(files['gene'], names[0])
+		chrom_genes = {chrom: len(set([line[4] for line in value])) for chrom, value in genes.items()}
+		chroms = sorted(indexes['gene'], key=SortedOutput.naturalKey)
+		sampled = Preview.sampleUnits(chroms, size, seed)
+		segments = {key: [segment for chrom in sampled for segment in index.get(chrom, [])] for key, index in indexes.items()}
+		inputs = loadInputs(files, names, promoter_dist, segments, executor, cis_only)
+		preview = {'unit': unit, 'units': sampled, 'x': [chrom_genes.get(chrom, 0) for chrom in sampled], \
+			'N': len(chroms), 'X': sum(chrom_genes.values())}
+	else:
+		inputs = loadInputs(files, names, promoter_dist, executor=executor, cis_only=cis_only)
+		gene_names = list(dict.fromkeys([line[4] for value in inputs['TSS'].values() for line in value]))
+		sampled, count = Preview.reservoirSample(gene_names, size, seed)
+		keep = set(sampled)
+		inputs['TSS'] = {chrom: [line for line in value if line[4] in keep] for chrom, value in inputs['TSS'].items()}
+		preview = {'unit': unit, 'units': sampled, 'x': [1] * len(sampled), 'N': count, 'X': count}
+	return(inputs, preview)
+
+
+def previewReport(degrees, preview, gene_name, target_name):
+# prints the counts of connected genes scaled up from the preview sample with their 95% confidence intervals
+	import Preview
+
+	connected = {}
+	for key in ('deg0', 'deg1', 'deg2', 'deg3'):
+		connected[key] = set([(chrom, item[4]) for chrom, value in degrees[key].items() for item in value])
+	connected['all'] = connected['deg0'] | connected['deg1'] | connected['deg2'] | connected['deg3']
+	labels = {'deg0': '0°', 'deg1': '1°', 'deg2': '2°', 'deg3': '3°', 'all': '0°, 1°, 2° or 3°'}
+	print('# Preview of', len(preview['units']), 'of', preview['N'], gene_name if preview['unit'] == 'genes' else 'chromosomes')
+	estimates = {}
+	for key, label in labels.items():
+		if preview['unit'] == 'chromosomes':
+			y = [len(set([gene for chrom, gene in connected[key] if chrom == unit])) for unit in preview['units']]
+		else:
+			genes = set([gene for chrom, gene in connected[key]])
+			y = [int(unit in genes) for unit in preview['units']]
+		estimates[key] = Preview.ratioEstimate(y, preview['x'], preview['X'], preview['N'])
+		print('# Estimated number of', gene_name, 'with', label, 'connections with', target_name, '=', \
+			Preview.formatEstimate(estimates[key]))
+	return(estimates)
+
+
+def printDegreeCounts(degrees, names):
+# prints the number of unique genes with each degree of connection; degrees is the dict returned by connectionAnalysis
+	gene_name, target_name, element1_name, element2_name = names
+	print('# Number of', gene_name, 'Directly Bound to', target_name, '(i.e. 0°', target_name, ') =', countUniqueGene(degrees['deg0']))
+	for key, name in (('deg1', target_name), ('deg1_element1', element1_name), ('deg1_element2', element2_name)):
+		print('# Number of', gene_name, 'Directly Looped to', name, '(i.e. 1°', name, ') =', countUniqueGene(degrees[key]))
+	count = countUniqueGene(degrees['deg2'])
+	print('# Number of', gene_name, 'Looped to', target_name, 'via', element1_name, 'or', element2_name, '(i.e. 2°', target_name, ') =', count)
+	count = countUniqueGene(degrees['deg3'])
+	print('# Number of', gene_name, 'with 3° connection with', target_name, 'via', element1_name, 'and', element2_name, '=', count)
+
+
+def mixedConnections(deg0, deg1, deg2, deg3):
+# returns dict of the genes connected to the target by each exclusive combination of connection degrees
+	deg0_deg1 = commonGenes(deg0, deg1)  # find genes whose connected to the anchor via multiple methods
+	deg0_deg2 = commonGenes(deg0, deg2)
+	deg0_deg3 = commonGenes(deg0, deg3)
+	deg1_deg2 = commonGenes(deg1, deg2)
+	deg1_deg3 = commonGenes(deg1, deg3)
+	deg2_deg3 = commonGenes(deg2, deg3)
+	deg0_deg1_deg2 = commonEntries(deg0_deg1, deg0_deg2)
+	deg0_deg2_deg3 = commonEntries(deg0_deg2, deg0_deg3)
+	deg0_deg1_deg3 = commonEntries(deg0_deg1, deg0_deg3)
+	deg1_deg2_deg3 = commonEntries(deg1_deg2, deg1_deg3)
+	deg0_deg1_deg2_deg3 = commonEntries(deg0_deg1_deg2, deg1_deg2_deg3)
+
+	deg0_deg1_deg2 = removeDuplicates(deg0_deg1_deg2, deg0_deg1_deg2_deg3)  # eliminate duplicates between multiple confirmation lists
+	deg0_deg2_deg3 = removeDuplicates(deg0_deg2_deg3, deg0_deg1_deg2_deg3)
+	deg0_deg1_deg3 = removeDuplicates(deg0_deg1_deg3, deg0_deg1_deg2_deg3)
+	deg1_deg2_deg3 = removeDuplicates(deg1_deg2_deg3, deg0_deg1_deg2_deg3)
+	deg0_deg1 = removeDuplicates(deg0_deg1, deg0_deg1_deg2, deg0_deg1_deg3, deg0_deg1_deg2_deg3)
+	deg0_deg2 = removeDuplicates(deg0_deg2, deg0_deg2_deg3, deg0_deg1_deg2, deg0_deg1_deg2_deg3)
+	deg0_deg3 = removeDuplicates(deg0_deg3, deg0_deg1_deg3, deg0_deg2_deg3, deg0_deg1_deg2_deg3)
+	deg1_deg2 = removeDuplicates(deg1_deg2, deg1_deg2_deg3, deg0_deg1_deg2, deg0_deg1_deg2_deg3)
+	deg1_deg3 = removeDuplicates(deg1_deg3, deg1_deg2_deg3, deg0_deg1_deg3, deg0_deg1_deg2_deg3)
+	deg2_deg3 = removeDuplicates(deg2_deg3, deg1_deg2_deg3, deg0_deg2_deg3, deg0_deg1_deg2_deg3)
+
+	return({'0° and 1°': deg0_deg1, '0° and 2°': deg0_deg2, '0° and 3°': deg0_deg3, '1° and 2°': deg1_deg2,
+		'1° and 3°': deg1_deg3, '2° and 3°': deg2_deg3, '0°, 1°, and 2°': deg0_deg1_deg2, '0°, 1°, and 3°': deg0_deg1_deg3,
+		'0°, 2°, and 3°': deg0_deg2_deg3, '1°, 2°, and 3°': deg1_deg2_deg3, '0°, 1°, 2°, and 3°': deg0_deg1_deg2_deg3})
+
+
+def connectionGeneSets(degrees, mixed):
+# returns dict of the sets of gene names connected to the target by each degree ('deg0' ... 'deg3'), by only that degree
+# ('deg0_only' ... 'deg3_only'), by each exclusive combination of degrees from mixedConnections ('deg0_deg1', ...) and
+# by any degree ('all_connected')
+	gene_sets = {}
+	for key in ('deg0', 'deg1', 'deg2', 'deg3'):
+		gene_sets[key] = set([item[4] for value in degrees[key].values() for item in value])
+	for key in ('deg0', 'deg1', 'deg2', 'deg3'):
+		others = set().union(*[gene_sets[other] for other in ('deg0', 'deg1', 'deg2', 'deg3') if other != key])
+		gene_sets[key + '_only'] = gene_sets[key] - others
+	for key, value in mixed.items():  # e.g. '0°, 1°, and 2°' -> 'deg0_deg1_deg2'
+		name = '_'.join(['deg' + character for character in key if character.isdigit()])
+		gene_sets[name] = set([item[4] for item in value])
+	gene_sets['all_connected'] = set().union(*[gene_sets[key] for key in ('deg0', 'deg1', 'deg2', 'deg3')])
+	return(gene_sets)
+
+
+def summarizeConnections(deg0, deg1, deg2, deg3, gene_name, target_name):
+# prints the number of unique genes connected to the target and the number of genes with mixed connections
+	unique_genes = uniqueGeneDict(deg0, deg1, deg2, deg3)  # store all genes whose TSS is connected to achor in some way in chr dict
+	mixed = mixedConnections(deg0, deg1, deg2, deg3)
+
+	count = countUniqueGene(unique_genes)
+	print('# Final Unique Counts for 0°, 1°, 2° and 3° connections between', gene_name, 'and', target_name, '=', count)
+	for key, value in mixed.items():
+		print('# Number of', gene_name, 'with', key, 'connections with', target_name, '=', len(value))
+	count = sum([len(value) for value in mixed.values()])
+	print('# Number of', gene_name, 'with mutiple mixed connections (0°, 1°, 2°, and/or 3°) with', target_name, '=', count)
+	return(mixed)
+
+
+def scorePath(scores, key, row):
+# adds a path of degree key (a deg0-deg3 output row) to the running scores of its gene: the number of paths for deg0,
+# else [paths, sum, max, min] of the path strengths, the count of the weakest loop of a path. The 'best' (strength,
+# degree, chain) of the gene is the strongest path, the first one found on ties. Returns scores
+	record = scores.setdefault(row[4], {})
+	if key == 'deg0':
+		record['deg0'] = [record.get('deg0', [0])[0] + 1]
+		return(scores)
+	count_columns, chain_columns = SCORE_COLUMNS[key]
+	strength = min([float(row[i]) for i in count_columns])
+	if key in record:
+		paths, total, maximum, minimum = record[key]
+		record[key] = [paths + 1, total + strength, max(maximum, strength), min(minimum, strength)]
+	else:
+		record[key] = [1, strength, strength, strength]
+	if 'best' not in record or strength > record['best'][0]:
+		chain = [row[chain_columns[0]]]
+		for count_column, chain_column in zip(count_columns, chain_columns[1:]):
+			chain.extend(['-' + str(row[count_column]) + '-', row[chain_column]])
+		record['best'] = (strength, key, ' '.join(chain))
+	return(scores)
+
+
+def mergeGeneScores(scores, other):
+# merges the gene scores of another set of paths (e.g. another chromosome) into scores and returns scores
+	for gene, record in other.items():
+		if gene not in scores:
+			scores[gene] = dict(record)  # a copy, as the merged values below replace its lists
+			continue
+		merged = scores[gene]
+		for key, value in record.items():
+			if key not in merged:
+				merged[key] = value
+			elif key == 'best':
+				if value[0] > merged[key][0] or (value[0] == merged[key][0] and value[1] < merged[key][1]):
+					merged[key] = value
+			elif key == 'deg0':
+				merged[key] = [merged[key][0] + value[0]]
+			else:
+				paths, total, maximum, minimum = merged[key]
+				merged[key] = [paths + value[0], total + value[1], max(maximum, value[2]), min(minimum, value[3])]
+	return(scores)
+
+
+def formatCount(value):
+# writes a loop count or strength without a trailing .0 when it is a whole number
+	if isinstance(value, float) and value.is_integer():
+		return(str(int(value)))
+	return(str(value))
+
+
+def writeGeneScores(scores, file):
+# writes the gene scores to a tab delimited table with one row per gene; degrees without a path have no max or min
+	header = ['gene', 'deg0_paths']
+	for key, count_columns, chain_columns in SCORE_LAYOUTS:
+		header.extend([key + '_paths', key + '_sum', key + '_max', key + '_min'])
+	header.extend(['best_degree', 'best_strength', 'best_chain'])
 	with open(file, 'w') as file:
-		for chrom, value in dictionary.items():
-			for item in value:
-				line = []
-				for entry in item:
-					entry = str(entry)
-					line.append(entry)
-				file.write(('\t').join(line) + '\n')
-print(timeit.default_timer() - start_time)
+		file.write('\t'.join(header) + '\n')
+		for gene in sorted(scores):
+			record = scores[gene]
+			line = [gene, record.get('deg0', [0])[0]]
+			for key, count_columns, chain_columns in SCORE_LAYOUTS:
+				line.extend(record.get(key, [0, 0, 'NA', 'NA']))
+			best = record.get('best', ('NA', 'deg0', 'NA'))
+			line.extend([best[1], best[0], best[2]])
+			file.write('\t'.join(map(formatCount, line)) + '\n')
+
+
+def outputResults(output_dicts, mode='w'):
+# writes each output dict sorted by chromosome and position to its output file; output_dicts is a list of (output file,
+# dict) pairs; mode 'a' appends to the output files. Returns the number of lines written to each file
+	counts = []
+	for item in output_dicts:
+		file, dictionary = item[0], item[1]
+		counts.append(SortedOutput.writeSortedOutput(dictionary, file, mode))
+	return(counts)
+
+
+def permutationAnalysis(inputs, options, gene_name, target_name):
+# compares the 0°-3° gene counts with those of shuffled target sets and prints the empirical enrichment p-values
+	import PermutationNull
+
+	if options['loops']:
+		loops = PermutationNull.readLoops(options['loops'], options['cis_only'] == 'yes')
+	else:
+		loops = PermutationNull.HiChIPLoops(inputs['HiChIP_target'], inputs['HiChIP_element1'], inputs['HiChIP_element2'])
+	sizes = PermutationNull.readChromosomeSizes(options['genome']) if options['genome'] else None
+	blacklist = PermutationNull.readIntervals(options['blacklist']) if options['blacklist'] else None
+	n_permutations = int(options['permutations'])
+	observed, null = PermutationNull.permutationTest(inputs, loops, n_permutations, int(options['seed']), sizes, blacklist, \
+		int(options['processes']))
+	rows = PermutationNull.enrichment(observed, null)
+
+	labels = {'deg0': '0°', 'deg1': '1°', 'deg2': '2°', 'deg3': '3°', 'all': '0°, 1°, 2° or 3°'}
+	print('# Permutation null of', n_permutations, 'shuffled', target_name, 'sets')
+	for degree, count, mean, sd, fold, p in rows:
+		print('# Number of', gene_name, 'with', labels[degree], 'connections with', target_name, '=', count, '; null mean =', \
+			round(mean, 2), '; null sd =', round(sd, 2), '; fold enrichment =', round(fold, 3), '; empirical p-value =', p)
+	if options['null_output']:
+		with open(options['null_output'], 'w') as file:
+			file.write('\t'.join(['degree', 'observed', 'null_mean', 'null_sd', 'fold_enrichment', 'empirical_p_value', 'permutations']) + '\n')
+			for row in rows:
+				file.write('\t'.join(map(str, row + [n_permutations])) + '\n')
+	return(rows)
+
+
+def getOptionalArguments(optional_arguments):
+# parse optional command=value arguments given after the positional arguments
+	options = {'engine': 'loops', 'mode': 'genome', 'database': None, 'processes': '1', 'permutations': '0', 'seed': '0', \
+		'loops': None, 'genome': None, 'blacklist': None, 'null_output': None, 'checkpoint': None, 'scores': None, \
+		'preview': '0', 'preview_unit': 'genes', 'cis_only': 'no', 'profile': None}
+	for item in optional_arguments:
+		command, value = item.split('=', 1)
+		if command in options:
+			options[command] = value
+	return(options)
+
+
+def main():
+	start_time = timeit.default_timer()
+	HiChIP_target_file = sys.argv[1] # loops targeted in the regulatory element of interest
+	HiChIP_element1_file = sys.argv[2]
+	HiChIP_element2_file = sys.argv[3]
+	target_file = sys.argv[4] # the element whose connection with the gene TSS is being analyzed
+	target_name = sys.argv[5]
+	gene_file = sys.argv[6]  # code writen for the gene to be the gene!
+	gene_name = sys.argv[7]
+	element1_file = sys.argv[8]  # other element that can act as a connection point between target and TSS
+	element1_name = sys.argv[9]
+	element2_file = sys.argv[10]  # other element that can act as a connection point between target and TSS
+	element2_name = sys.argv[11]
+	deg0_output_file = sys.argv[12]
+	deg1_output_file = sys.argv[13]
+	deg2_output_file = sys.argv[14]
+	deg3_output_file = sys.argv[15]
+	promoter_dist = int(sys.argv[16])
+	options = getOptionalArguments(sys.argv[17:])
+	names = (gene_name, target_name, element1_name, element2_name)
+	files = {'HiChIP_target': HiChIP_target_file, 'HiChIP_element1': HiChIP_element1_file, 'HiChIP_element2': HiChIP_element2_file, \
+		'target': target_file, 'gene': gene_file, 'element1': element1_file, 'element2': element2_file}
+	output_files = [deg0_output_file, deg1_output_file, deg2_output_file, deg3_output_file]
+	cis_only = options['cis_only'] == 'yes'
+	if options['mode'] == 'chromosome' and int(options['preview']) == 0 and not cis_only:
+		print('# Chromosome mode loads one chromosome at a time; inter-chromosomal loops are dropped')
+		cis_only = True
+	if options['profile']:  # sample where the time goes with low overhead
+		Profiler.start(options['profile'], 'MasterConnections')
+
+	work_dir = options['checkpoint']
+	if work_dir:  # resume from the checkpoints of a previous run with the same arguments and input files
+		key = Checkpoint.runKey([names, promoter_dist, options['engine'], options['mode'], cis_only], files.values())
+		if Checkpoint.openWorkDir(work_dir, key):
+			print('# Resuming from the checkpoints in', work_dir)
+
+	executor = None
+	if int(options['processes']) > 1:  # parse the input files in parallel
+		executor = ProcessPoolExecutor(max_workers=min(int(options['processes']), len(files)))
+
+	scores = None
+	if options['scores'] and options['engine'] == 'sparse':
+		print('# Gene scores need the loop counts of the loop engine; no scores written')
+	elif options['scores']:
+		scores = {}
+
+	preview = None
+	if options['mode'] == 'chromosome' and int(options['preview']) == 0:
+		inputs = None
+		degrees = chromosomeAnalysis(files, names, promoter_dist, options['engine'], output_files, options['database'], executor, \
+			work_dir, scores, cis_only)
+	else:
+		if int(options['preview']) > 0:  # analyze a deterministic random sample of the genes or chromosomes
+			with Profiler.section('inputs'):
+				inputs, preview = previewInputs(files, names, promoter_dist, options['preview_unit'], int(options['preview']), \
+					int(options['seed']), executor, cis_only)
+			degrees = runAnalysis(inputs, options['engine'])
+		else:  # write input files to dictionary with chrom as key
+			inputs, degrees = resumeAnalysis(files, names, promoter_dist, options['engine'], executor=executor, work_dir=work_dir, \
+				cis_only=cis_only)
+		with Profiler.section('output'):
+			outputResults(zip(output_files, [degrees['deg0'], degrees['deg1'], degrees['deg2'], degrees['deg3']]))
+			if options['database']:
+				databaseResults(options['database'], degrees, options['engine'])
+		if scores is not None:
+			scores = degrees['scores']
+	if scores is not None:
+		writeGeneScores(scores, options['scores'])
+
+	if int(options['permutations']) > 0 and inputs is None:  # the null shuffles peaks over the whole genome
+		with Profiler.section('inputs'):
+			inputs = Checkpoint.stage(work_dir, 'inputs', loadInputs, files, names, promoter_dist, None, executor, cis_only)
+	if executor is not None:
+		executor.shutdown()
+
+	printDegreeCounts(degrees, names)
+	summarizeConnections(degrees['deg0'], degrees['deg1'], degrees['deg2'], degrees['deg3'], gene_name, target_name)
+	if preview is not None:
+		previewReport(degrees, preview, gene_name, target_name)
+	if int(options['permutations']) > 0:
+		with Profiler.section('permutations'):
+			permutationAnalysis(inputs, options, gene_name, target_name)
+	Profiler.stop()
+	print(timeit.default_timer() - start_time)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,355 @@
+"""
+Title:		PermutationNull.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Genomic permutation null for the number of genes with 0°, 1°, 2° and 3° connections to the target found by
+MasterConnections.py. The target peaks are shuffled within their chromosomes (keeping their widths and optionally
+avoiding blacklist regions) and the connections are recounted for every shuffled target set. Everything that does not
+depend on the target position is built once: the TSSs, the 1° connections of the TSSs to the secondary and tertiary
+elements, the element reach matrices of SparseConnections.py and the overlaps of every loop contact bin with the TSSs and
+element anchors. Each permutation then only has to overlap the shuffled peaks with the loop contact bins, re-anchor the
+loops as AnchorLoops.py would, and evaluate a few sparse matrix-vector products:
+
+	0° 	TSSs overlapping a shuffled peak
+	1° 	TSSs in the distal bin of a loop anchored in a shuffled peak
+	2° 	TSSs 1° connected to an element whose loop reaches a shuffled peak
+	3° 	TSSs 1° connected to an element that loops to a second element reached by a loop anchored in a shuffled peak,
+		where neither the TSS nor the first element is
+
+The loops anchored in the shuffled peaks are taken from the loop universe, ideally the HiChIP file given to AnchorLoops.py;
+otherwise the loops of the three AnchorLoops.py outputs are used, which only contains loops anchored in a target or
+element. Permutations are spread over worker processes and seeded per permutation, so the result does not depend on
+the number of processes. Requires numpy and scipy.
+"""
+
+import numpy as np  # version=1.20.2
+from concurrent.futures import ProcessPoolExecutor
+import LoopIndex
+import SparseConnections
+from SparseConnections import intervalTable, overlapMatrix
+
+DEGREES = ('deg0', 'deg1', 'deg2', 'deg3', 'all')
+MAX_DRAWS = 1000  # maximum number of draws to place a peak outside the blacklist
+WORKER_MODEL = {}  # null model of the worker processes, set by initWorker
+
+
+def readLoops(file, cis_only=False):
+	'''
+	Reads the unique loops of a HiChIP file (chr1 start1 stop1 chr2 start2 stop2 ...) with LoopIndex.uniqueLoops,
+	adding 'chr' in front of the chromosomes if it is not there as AnchorLoops.py does.
+
+	@file 	path to the HiChIP file
+	@cis_only 	whether inter-chromosomal loops are dropped
+	@return 	list of unique (chrom1, start1, stop1, chrom2, start2, stop2) tuples
+	'''
+	lines = []
+	with open(file, 'r') as file:
+		for line in file:
+			line = line.rstrip('\r\n').split('\t')
+			chrom1 = line[0] if line[0][0:3] == 'chr' else 'chr' + line[0]
+			chrom2 = line[3] if line[3][0:3] == 'chr' else 'chr' + line[3]
+			lines.append((chrom1, int(line[1]), int(line[2]), chrom2, int(line[4]), int(line[5])))
+	return(LoopIndex.uniqueLoops(lines, cis_only))
+
+
+def HiChIPLoops(*HiChIP_dicts):
+	'''
+	Returns the unique loops of chr dictionaries of AnchorLoops.py outputs, in which an inter-chromosomal loop is listed
+	under both of its chromosomes.
+
+	@HiChIP_dicts 	chr dictionaries of the HiChIP files (loop in item[:6])
+	@return 	list of unique (chrom1, start1, stop1, chrom2, start2, stop2) tuples
+	'''
+	lines = [(item[0], int(item[1]), int(item[2]), item[3], int(item[4]), int(item[5])) \
+		for HiChIP_dict in HiChIP_dicts for value in HiChIP_dict.values() for item in value]
+	return(LoopIndex.uniqueLoops(lines))
+
+
+def readIntervals(file):
+	'''
+	Reads a bed file into a dictionary of sorted, merged intervals per chromosome.
+
+	@file 	path to the bed file
+	@return 	dictionary with chrom as key and a tuple of numpy arrays (starts, stops) as value
+	'''
+	intervals = {}
+	with open(file, 'r') as file:
+		for line in file:
+			line = line.rstrip('\r\n').split('\t')
+			intervals.setdefault(line[0], []).append((int(line[1]), int(line[2])))
+	merged = {}
+	for chrom, value in intervals.items():
+		starts, stops = [], []
+		for start, stop in sorted(value):
+			if starts and start <= stops[-1]:
+				stops[-1] = max(stops[-1], stop)
+			else:
+				starts.append(start)
+				stops.append(stop)
+		merged[chrom] = (np.array(starts, dtype=np.int64), np.array(stops, dtype=np.int64))
+	return(merged)
+
+
+def readChromosomeSizes(file):
+	'''
+	Reads a chromosome sizes file (chrom size, e.g. hg19.chrom.sizes).
+
+	@file 	path to the chromosome sizes file
+	@return 	dictionary with chrom as key and size as value
+	'''
+	sizes = {}
+	with open(file, 'r') as file:
+		for line in file:
+			line = line.rstrip('\r\n').split('\t')
+			sizes[line[0]] = int(line[1])
+	return(sizes)
+
+
+def dataExtent(*tables):
+	'''
+	Returns the largest stop coordinate per chromosome of interval tables, used as the chromosome size when no chromosome
+	sizes file is given.
+
+	@tables 	interval tables (see SparseConnections.intervalTable)
+	@return 	dictionary with chrom as key and largest stop as value
+	'''
+	sizes = {}
+	for table in tables:
+		for chrom in np.unique(table['chrom']):
+			stop = int(table['stop'][table['chrom'] == chrom].max())
+			sizes[chrom] = max(sizes.get(chrom, 0), stop)
+	return(sizes)
+
+
+def shuffleGroups(targets, sizes, blacklist=None):
+	'''
+	Groups the target peaks by chromosome for shuffling.
+
+	@targets 	interval table of the target peaks
+	@sizes 	dictionary of chromosome sizes
+	@blacklist 	dictionary of merged blacklist intervals per chromosome (see readIntervals) or None
+	@return 	list of (peak indices, peak widths, chromosome size, blacklist starts, blacklist stops) tuples
+	'''
+	if blacklist is None:
+		blacklist = {}
+	empty = np.empty(0, dtype=np.int64)
+	groups = []
+	for chrom in np.unique(targets['chrom']):
+		if chrom not in sizes:
+			raise ValueError('Chromosome ' + chrom + ' of the target peaks is not in the chromosome sizes file')
+		idx = np.flatnonzero(targets['chrom'] == chrom)
+		widths = targets['stop'][idx] - targets['start'][idx]
+		starts, stops = blacklist.get(chrom, (empty, empty))
+		groups.append((idx, widths, sizes[chrom], starts, stops))
+	return(groups)
+
+
+def shuffleIntervals(targets, groups, rng):
+	'''
+	Places every target peak at a uniformly random position on its chromosome keeping its width. Peaks overlapping a
+	blacklist interval are drawn again.
+
+	@targets 	interval table of the target peaks
+	@groups 	list returned by shuffleGroups
+	@rng 	numpy random Generator
+	@return 	interval table of the shuffled peaks
+	'''
+	start = np.empty_like(targets['start'])
+	for idx, widths, size, black_starts, black_stops in groups:
+		span = np.maximum(size - widths, 0) + 1
+		pos = rng.integers(0, span)
+		redraw = np.arange(len(idx))
+		for draw in range(MAX_DRAWS):
+			if len(black_starts) == 0:
+				break
+			i = np.searchsorted(black_stops, pos[redraw], side='right')  # first blacklist interval ending after the start
+			inside = i < len(black_starts)
+			inside[inside] = black_starts[i[inside]] < pos[redraw][inside] + widths[redraw][inside]
+			redraw = redraw[inside]
+			if len(redraw) == 0:
+				break
+			pos[redraw] = rng.integers(0, span[redraw])
+		else:
+			raise ValueError('Could not place ' + str(len(redraw)) + ' shuffled peaks outside the blacklist')
+		start[idx] = pos
+	return({'chrom': targets['chrom'], 'start': start, 'stop': start + (targets['stop'] - targets['start'])})
+
+
+def widen(table):
+	'''
+	Returns an interval table extended by 1 bp on both sides, so the half-open overlap of overlapMatrix matches the
+	inclusive overlap of AnchorLoops.py (start <= bin stop and stop >= bin start).
+
+	@table 	interval table
+	@return 	widened interval table
+	'''
+	return({'chrom': table['chrom'], 'start': table['start'] - 1, 'stop': table['stop'] + 1})
+
+
+def rowHits(matrix):
+	'''
+	Returns a boolean array marking the rows of a sparse matrix with at least one non-zero entry.
+
+	@matrix 	sparse matrix
+	@return 	boolean numpy array
+	'''
+	return(matrix.tocsr().getnnz(axis=1) > 0)
+
+
+def nullModel(inputs, loops):
+	'''
+	Builds the target independent structures of the null model from the chr dicts returned by
+	MasterConnections.loadInputs.
+
+	@inputs 	dictionary of the input chr dicts ('TSS', 'element1', 'element2', 'HiChIP_element1', 'HiChIP_element2')
+	@loops 	list of (chrom1, start1, stop1, chrom2, start2, stop2) tuples of the loop universe
+	@return 	dictionary of the interval tables, incidence matrices and gene ids used by connectionCounts
+	'''
+	TSS_rows = [line for value in inputs['TSS'].values() for line in value]
+	TSS_table = intervalTable([(line[1], line[2], line[3]) for line in TSS_rows])
+	gene_ids = np.unique([line[4] for line in TSS_rows], return_inverse=True)[1] if TSS_rows else np.empty(0, dtype=np.int64)
+	beds = {name: intervalTable([(line[1], line[2], line[3]) for value in inputs[name].values() for line in value]) \
+		for name in ('element1', 'element2')}
+	bin1 = intervalTable([(loop[0], loop[1], loop[2]) for loop in loops])
+	bin2 = intervalTable([(loop[3], loop[4], loop[5]) for loop in loops])
+	model = {'TSS': TSS_table, 'gene_ids': gene_ids, 'bin1': bin1, 'bin2': bin2, 'bin1_wide': widen(bin1), 'bin2_wide': widen(bin2),
+		'bin1_TSS': overlapMatrix(bin1, TSS_table), 'bin2_TSS': overlapMatrix(bin2, TSS_table)}
+
+	# 1° connections of the TSSs to the elements and the element reach matrices, as in SparseConnections.sparseConnections
+	bin_index, element_loops = {}, {}
+	for name in ('element1', 'element2'):
+		element_loops[name] = SparseConnections.loopIncidence(inputs['HiChIP_' + name], bin_index)
+	bins = intervalTable(sorted(bin_index, key=bin_index.get))
+	bins_TSS = overlapMatrix(bins, TSS_table)
+	model['element_bins'] = bins
+	model['deg2'] = None
+	for name, loop in element_loops.items():
+		loop['distal'] = SparseConnections.distalMatrix(loop, len(bin_index))
+		row_TSS = (loop['distal'] @ bins_TSS).tocsr()
+		deg1 = (row_TSS.T @ loop['anchor']).tocsr()  # TSS x anchored element
+		anchor_distal = SparseConnections.connectedAnchorDistal(loop, row_TSS)
+		TSS_distal = (deg1 @ anchor_distal).tocsr()  # TSS x bin reached via the element
+		model['deg2'] = TSS_distal if model['deg2'] is None else model['deg2'] + TSS_distal
+		model[name] = {'deg1': deg1,
+			'reach': {bed: (anchor_distal @ overlapMatrix(bins, beds[bed])).tocsr() for bed in beds},
+			'bin1_anchor': overlapMatrix(bin1, loop['anchors']), 'bin2_anchor': overlapMatrix(bin2, loop['anchors']),
+			'bin1_bed': overlapMatrix(bin1, beds[name]), 'bin2_bed': overlapMatrix(bin2, beds[name])}
+	return(model)
+
+
+def distalHits(distal, bin1_matrix, bin2_matrix):
+	'''
+	Returns a boolean array marking the features in the distal bin of at least one anchored loop.
+
+	@distal 	tuple of integer arrays marking the loops whose distal bin is bin 1 and bin 2
+	@bin1_matrix 	loop x feature overlap matrix of bin 1
+	@bin2_matrix 	loop x feature overlap matrix of bin 2
+	@return 	boolean numpy array of length number of features
+	'''
+	return((distal[0] @ bin1_matrix + distal[1] @ bin2_matrix) > 0)
+
+
+def connectionCounts(model, targets):
+	'''
+	Counts the unique genes with 0°, 1°, 2° and 3° connections (and any connection) to a set of target peaks.
+
+	@model 	dictionary returned by nullModel
+	@targets 	interval table of the target peaks
+	@return 	numpy array of the gene counts in the order of DEGREES
+	'''
+	connected = {'deg0': rowHits(overlapMatrix(model['TSS'], targets))}
+
+	# loops anchored in a peak as in AnchorLoops.py; the distal bin is bin 2 for the peaks in bin 1 and bin 1 otherwise
+	in_bin1 = overlapMatrix(model['bin1'], targets).getnnz(axis=1)
+	anchored = (overlapMatrix(model['bin1_wide'], targets) + overlapMatrix(model['bin2_wide'], targets)).getnnz(axis=1)
+	distal = ((anchored > in_bin1).astype(np.int64), (in_bin1 > 0).astype(np.int64))
+
+	connected['deg1'] = distalHits(distal, model['bin1_TSS'], model['bin2_TSS'])
+	bin_hits = rowHits(overlapMatrix(model['element_bins'], targets)).astype(np.int64)
+	connected['deg2'] = (model['deg2'] @ bin_hits) > 0
+
+	final = {name: distalHits(distal, model[name]['bin1_bed'], model[name]['bin2_bed']).astype(np.int64) for name in ('element1', 'element2')}
+	paths = np.zeros(len(model['gene_ids']), dtype=np.int64)
+	for first in ('element1', 'element2'):
+		element = model[first]
+		via = element['reach']['element1'] @ final['element1'] + element['reach']['element2'] @ final['element2']
+		via = via * ~distalHits(distal, element['bin1_anchor'], element['bin2_anchor'])
+		paths += element['deg1'] @ via
+	connected['deg3'] = (paths > 0) & ~connected['deg1']
+	connected['all'] = connected['deg0'] | connected['deg1'] | connected['deg2'] | connected['deg3']
+	return(np.array([len(np.unique(model['gene_ids'][connected[key]])) for key in DEGREES], dtype=np.int64))
+
+
+def initWorker(model):
+	'''
+	Stores the null model in a worker process so it is sent once per worker rather than once per permutation.
+
+	@model 	dictionary of the null model, the target peaks and the shuffle groups
+	'''
+	WORKER_MODEL.update(model)
+
+
+def permutationCounts(seeds):
+	'''
+	Shuffles the target peaks once per seed and counts the connected genes of each shuffled set.
+
+	@seeds 	list of numpy SeedSequence objects, one per permutation
+	@return 	numpy array of shape (number of seeds, len(DEGREES))
+	'''
+	counts = np.empty((len(seeds), len(DEGREES)), dtype=np.int64)
+	for i, seed in enumerate(seeds):
+		shuffled = shuffleIntervals(WORKER_MODEL['targets'], WORKER_MODEL['groups'], np.random.default_rng(seed))
+		counts[i] = connectionCounts(WORKER_MODEL['model'], shuffled)
+	return(counts)
+
+
+def permutationTest(inputs, loops, n_permutations, seed=0, sizes=None, blacklist=None, processes=1):
+	'''
+	Counts the connected genes for the observed target peaks and for n_permutations shuffled target sets.
+
+	@inputs 	dictionary of the input chr dicts returned by MasterConnections.loadInputs
+	@loops 	list of (chrom1, start1, stop1, chrom2, start2, stop2) tuples of the loop universe
+	@n_permutations 	number of shuffled target sets
+	@seed 	random seed
+	@sizes 	dictionary of chromosome sizes; defaults to the extent of the inputs
+	@blacklist 	dictionary of merged blacklist intervals per chromosome (see readIntervals) or None
+	@processes 	number of worker processes
+	@return 	numpy array of the observed counts and numpy array of shape (n_permutations, len(DEGREES)) of the null
+	'''
+	model = nullModel(inputs, loops)
+	targets = intervalTable([(line[1], line[2], line[3]) for value in inputs['target'].values() for line in value])
+	if sizes is None:
+		sizes = dataExtent(targets, model['TSS'], model['bin1'], model['bin2'], model['element_bins'])
+	state = {'model': model, 'targets': targets, 'groups': shuffleGroups(targets, sizes, blacklist)}
+	observed = connectionCounts(model, targets)
+
+	seeds = np.random.SeedSequence(seed).spawn(n_permutations)
+	if processes > 1:
+		chunk = max(1, n_permutations // (processes * 4))
+		chunks = [seeds[i:i + chunk] for i in range(0, n_permutations, chunk)]
+		with ProcessPoolExecutor(max_workers=processes, initializer=initWorker, initargs=(state,)) as executor:
+			null = list(executor.map(permutationCounts, chunks))
+	else:
+		initWorker(state)
+		null = [permutationCounts(seeds)]
+	return(observed, np.concatenate(null) if null else np.empty((0, len(DEGREES)), dtype=np.int64))
+
+
+def enrichment(observed, null):
+	'''
+	Summarizes the permutation null of each degree with the empirical one-sided enrichment p-value
+	(1 + number of permutations with at least the observed count) / (1 + number of permutations).
+
+	@observed 	numpy array of the observed counts in the order of DEGREES
+	@null 	numpy array of shape (n_permutations, len(DEGREES))
+	@return 	list of [degree, observed, null mean, null sd, fold enrichment, empirical p-value] rows
+	'''
+	rows = []
+	for i, key in enumerate(DEGREES):
+		mean = null[:, i].mean() if len(null) else float('nan')
+		sd = null[:, i].std(ddof=1) if len(null) > 1 else float('nan')
+		fold = observed[i] / mean if mean else float('nan')
+		p = (1 + np.count_nonzero(null[:, i] >= observed[i])) / (1 + len(null))
+		rows.append([key, int(observed[i]), mean, sd, fold, p])
+	return(rows)
@@ -0,0 +1,98 @@
+"""
+Title:		Preview.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Sampling and estimation for the preview mode of MasterConnections.py and AnchorLoops.py. A deterministic random sample
+of units (genes, chromosomes, features or loops) is run through the usual code path, and every count that is a sum over
+the units (e.g. the number of genes with a 1° connection is a sum of one indicator per gene) is scaled up to the whole
+input with the ratio estimator
+
+	estimate = X * sum(y) / sum(x)
+
+where y is the count of each sampled unit, x its size (1 for genes, features and loops; the number of genes for
+chromosomes) and X the total size of all units. The 95% confidence interval uses the variance of the ratio estimator
+with the finite population correction, so it shrinks to the exact count as the sample approaches the whole input.
+Only the Python standard library is required.
+"""
+
+import math
+import random
+
+Z = 1.959963984540054  # two-sided 95% normal quantile
+
+
+def reservoirSample(items, k, seed=0):
+	'''
+	Draws a uniform random sample of k items from an iterable of unknown length in a single pass (reservoir sampling
+	with geometric skips, Algorithm L). The sample only depends on the seed and the order of the items.
+
+	@items 	iterable of items
+	@k 	sample size
+	@seed 	random seed
+	@return 	list of the sampled items in their original order
+	@return 	number of items seen
+	'''
+	rng = random.Random(seed)
+	reservoir = []
+	n = 0
+	w = math.exp(math.log(1 - rng.random()) / k) if k > 0 else 0
+	next_index = k + int(math.log(1 - rng.random()) / math.log1p(-w)) if 0 < w < 1 else k
+	for n, item in enumerate(items, 1):
+		if n <= k:
+			reservoir.append((n, item))
+		elif k > 0 and n - 1 == next_index:  # replace a random item of the reservoir and draw the next skip
+			reservoir[rng.randrange(k)] = (n, item)
+			w *= math.exp(math.log(1 - rng.random()) / k)
+			next_index += 1 + int(math.log(1 - rng.random()) / math.log1p(-w)) if w < 1 else 1
+	reservoir.sort(key=lambda entry: entry[0])
+	return([item for i, item in reservoir], n)
+
+
+def sampleUnits(units, k, seed=0):
+	'''
+	Draws a deterministic random sample of k units of a list, keeping their original order.
+
+	@units 	list of units
+	@k 	sample size (all units if k is larger than the list)
+	@seed 	random seed
+	@return 	list of the sampled units
+	'''
+	chosen = set(random.Random(seed).sample(range(len(units)), min(k, len(units))))
+	return([unit for i, unit in enumerate(units) if i in chosen])
+
+
+def ratioEstimate(y, x, X, N):
+	'''
+	Scales the counts of a sample of units up to the whole input and returns the 95% confidence interval.
+
+	@y 	list of the counts of the sampled units
+	@x 	list of the sizes of the sampled units
+	@X 	total size of all units
+	@N 	total number of units
+	@return 	estimate, lower and upper bound of the 95% confidence interval; the lower bound is at least the
+				observed count
+	'''
+	k = len(y)
+	if k == 0 or sum(x) == 0:
+		return(float('nan'), float('nan'), float('nan'))
+	ratio = sum(y) / sum(x)
+	estimate = X * ratio
+	if k > 1:
+		residuals = [y_i - ratio * x_i for y_i, x_i in zip(y, x)]
+		variance = N ** 2 * (1 - k / N) * sum([d ** 2 for d in residuals]) / (k - 1) / k
+	else:
+		variance = float('nan')
+	half = Z * math.sqrt(max(variance, 0)) if variance == variance else float('nan')
+	return(estimate, max(estimate - half, float(sum(y))), estimate + half)
+
+
+def formatEstimate(estimate):
+	'''
+	Formats an estimate and its confidence interval for printing.
+
+	@estimate 	tuple returned by ratioEstimate
+	@return 	string 'estimate (95% CI lower - upper)'
+	'''
+	value, low, high = [round(number, 1) for number in estimate]
+	return(str(value) + ' (95% CI ' + str(low) + ' - ' + str(high) + ')')
@@ -0,0 +1,186 @@
+"""
+Title:		Profiler.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Opt-in sampling profiler of MasterConnections.py, Deg1LoopChecker.py and AnchorLoops.py (optional argument
+profile=out.json). The overlap predicates (checkBin, middleBin, binChecker, DistalConnectCheck, ...) are called for
+every pair of a feature and a loop, so a deterministic profiler such as cProfile spends more time in its per-call hook
+than in the predicates themselves. Instead a background thread wakes every INTERVAL seconds and records the call stack
+of the main thread, weighted by the wall time since the previous sample, so the overhead does not depend on the number
+of calls. Every stack is rooted at the script and the stage and chromosome sections the scripts open with section(), so
+the time of every stage and chromosome and the hot path within it can be read off a flamegraph. The exact wall time of
+the sections is measured as well and the top level sections are printed.
+
+The profile is written as speedscope JSON (open it at https://www.speedscope.app) if the path ends with .json, holding
+the sampled stacks and the timeline of the sections, else as collapsed stacks ('frame;frame;frame count' lines) for
+flamegraph.pl or inferno. Only the main process is sampled; the time it waits for worker processes shows as the
+waiting frame. Only the Python standard library is required.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+INTERVAL = 0.005  # seconds between two samples of the main thread
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+ACTIVE = None  # state of the running profiler; None while profiling is off
+
+
+def start(path, name, interval=INTERVAL):
+	'''
+	Starts sampling the calling thread, which should be the main thread of the script.
+
+	@path 	path of the profile written by stop()
+	@name 	name of the root frame of every stack (the script)
+	@interval 	seconds between two samples
+	'''
+	global ACTIVE
+	ACTIVE = {'path': path, 'name': name, 'interval': interval, 'thread': threading.get_ident(), 'sections': [name], \
+		'stacks': {}, 'times': {}, 'events': [('O', name, 0.0)], 'start': time.perf_counter(), 'done': threading.Event()}
+	ACTIVE['sampler'] = threading.Thread(target=sample, args=(ACTIVE,), daemon=True)
+	ACTIVE['sampler'].start()
+
+
+def sample(state):
+	'''
+	Samples the stack of the profiled thread every interval until stop() is called. The stacks are aggregated to
+	the number of samples and the seconds attributed to them.
+
+	@state 	profiler state created by start()
+	'''
+	last = time.perf_counter()
+	while not state['done'].wait(state['interval']):
+		frame = sys._current_frames().get(state['thread'])
+		now = time.perf_counter()
+		if frame is None:  # the profiled thread has exited
+			break
+		stack = []
+		while frame is not None:
+			code = frame.f_code
+			stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+			frame = frame.f_back
+		key = tuple(state['sections']) + tuple(reversed(stack))
+		weight = state['stacks'].setdefault(key, [0, 0.0])
+		weight[0] += 1
+		weight[1] += now - last
+		last = now
+
+
+@contextmanager
+def section(label):
+	'''
+	Opens a section of the profile, such as a stage or a chromosome, for the duration of a with block. The section
+	is added to the root of every stack sampled within it and its wall time is measured. Does nothing while profiling
+	is off, so the scripts call it unconditionally.
+
+	@label 	name of the section
+	'''
+	state = ACTIVE
+	if state is None:
+		yield
+		return
+	sections = state['sections']
+	sections.append(label)
+	path = tuple(sections)
+	begin = time.perf_counter()
+	state['events'].append(('O', label, begin - state['start']))
+	try:
+		yield
+	finally:
+		end = time.perf_counter()
+		state['events'].append(('C', label, end - state['start']))
+		state['times'][path] = state['times'].get(path, 0.0) + end - begin
+		sections.pop()
+
+
+def frameName(frame):
+	'''
+	Returns the name of a frame of a sampled stack for the collapsed stacks.
+
+	@frame 	section label or (function, file, line) tuple
+	@return 	string 'label' or 'function (file:line)'
+	'''
+	if isinstance(frame, str):
+		return(frame)
+	return(frame[0] + ' (' + os.path.basename(frame[1]) + ':' + str(frame[2]) + ')')
+
+
+def writeCollapsed(state, path):
+	'''
+	Writes the sampled stacks in the collapsed format of flamegraph.pl: the frames of a stack from the root joined by
+	';' followed by the number of samples.
+
+	@state 	profiler state
+	@path 	output file path
+	'''
+	with open(path, 'w') as file:
+		for key, (count, seconds) in state['stacks'].items():
+			file.write(';'.join([frameName(frame) for frame in key]) + ' ' + str(count) + '\n')
+
+
+def writeSpeedscope(state, path, total):
+	'''
+	Writes the profile in the speedscope JSON format: a sampled profile of the stacks weighted by seconds and an evented
+	profile of the timeline of the sections.
+
+	@state 	profiler state
+	@path 	output file path
+	@total 	seconds profiled
+	'''
+	frames, frame_ids = [], {}
+
+	def frameId(frame):
+		if frame not in frame_ids:
+			frame_ids[frame] = len(frames)
+			if isinstance(frame, str):
+				frames.append({'name': frame})
+			else:
+				frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+		return(frame_ids[frame])
+
+	samples, weights = [], []
+	for key, (count, seconds) in state['stacks'].items():
+		samples.append([frameId(frame) for frame in key])
+		weights.append(seconds)
+	events = [{'type': kind, 'frame': frameId(label), 'at': at} for kind, label, at in state['events']]
+	profiles = [{'type': 'sampled', 'name': state['name'] + ' samples', 'unit': 'seconds', 'startValue': 0, \
+		'endValue': sum(weights), 'samples': samples, 'weights': weights}, \
+		{'type': 'evented', 'name': state['name'] + ' sections', 'unit': 'seconds', 'startValue': 0, 'endValue': total, \
+		'events': events}]
+	with open(path, 'w') as file:
+		json.dump({'$schema': SPEEDSCOPE_SCHEMA, 'name': state['name'], 'exporter': 'Profiler.py', \
+			'shared': {'frames': frames}, 'profiles': profiles}, file)
+
+
+def stop():
+	'''
+	Stops sampling, writes the profile and prints the wall time of the top level sections. Does nothing while profiling
+	is off.
+
+	@return 	path of the profile written or None
+	'''
+	global ACTIVE
+	state = ACTIVE
+	if state is None:
+		return(None)
+	ACTIVE = None
+	state['done'].set()
+	state['sampler'].join()
+	total = time.perf_counter() - state['start']
+	state['events'].append(('C', state['name'], total))
+	if state['path'].endswith('.json'):
+		writeSpeedscope(state, state['path'], total)
+	else:
+		writeCollapsed(state, state['path'])
+
+	samples = sum([count for count, seconds in state['stacks'].values()])
+	print('# Profile of', samples, 'samples over', round(total, 3), 's written to', state['path'])
+	for path, seconds in state['times'].items():
+		if len(path) == 2:
+			print('# Profile:', path[1], '=', round(seconds, 3), 's')
+	return(state['path'])
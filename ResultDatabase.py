@@ -0,0 +1,129 @@
+"""
+Title:		ResultDatabase.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Writes the result tables of MasterConnections.py and Deg1LoopChecker.py to a SQLite database with named, typed columns
+and indexes on chromosome, gene and anchor coordinates, so results can be filtered with an indexed query instead of
+re-parsing the text outputs, e.g.
+
+	import sqlite3
+	connection = sqlite3.connect('results.sqlite')
+	connection.execute('SELECT * FROM deg1 WHERE gene = ?', ('MYC',)).fetchall()
+
+Only the Python standard library is required.
+"""
+
+import sqlite3
+
+BATCH_SIZE = 100000  # number of rows inserted per executemany call
+
+# columns of the entries written by the scripts; None marks the 'loop_count' separator entries, which are not stored
+TSS_COLUMNS = [('gene_set', 'TEXT'), ('chrom', 'TEXT'), ('tss_start', 'INTEGER'), ('tss_stop', 'INTEGER'), ('gene', 'TEXT')]
+ELEMENT_COLUMNS = [('element_name', 'TEXT'), ('element_chrom', 'TEXT'), ('element_start', 'INTEGER'),
+	('element_stop', 'INTEGER'), ('element_id', 'TEXT')]
+
+
+def loopColumns(prefix, label=True):
+	'''
+	Returns the columns of the loop information (count, fdr, ID and optionally label) carried from a HiChIP file.
+
+	@prefix 	prefix of the column names
+	@label 	whether the loop label column is included
+	@return 	list of (column name, type) tuples
+	'''
+	columns = [(prefix + '_count', 'INTEGER'), (prefix + '_fdr', 'REAL'), (prefix + '_id', 'TEXT')]
+	if label:
+		columns.append((prefix + '_label', 'TEXT'))
+	return(columns)
+
+
+def anchorColumns(prefix):
+	'''
+	Returns the columns of the coordinates + ID of an element anchored in a loop.
+
+	@prefix 	prefix of the column names
+	@return 	list of (column name, type) tuples
+	'''
+	return([(prefix + '_chrom', 'TEXT'), (prefix + '_start', 'INTEGER'), (prefix + '_stop', 'INTEGER'), (prefix + '_id', 'TEXT')])
+
+
+DEG1_COLUMNS = TSS_COLUMNS + [(None, None)] + loopColumns('loop1') + anchorColumns('anchor1')
+DEG2_COLUMNS = DEG1_COLUMNS + [(None, None)] + loopColumns('loop2', label=False) + ELEMENT_COLUMNS
+MASTER_CONNECTIONS = {
+	'deg0': TSS_COLUMNS + [('target_name', 'TEXT'), ('target_chrom', 'TEXT'), ('target_start', 'INTEGER'),
+		('target_stop', 'INTEGER'), ('target_id', 'TEXT')],
+	'deg1': DEG1_COLUMNS,
+	'deg2': DEG2_COLUMNS,
+	'deg3': DEG2_COLUMNS + [(None, None)] + loopColumns('loop3') + anchorColumns('anchor3')}
+DEG1_LOOP_CHECKER = [('chrom', 'TEXT'), ('start', 'INTEGER'), ('stop', 'INTEGER'), ('id', 'TEXT')] + \
+	loopColumns('loop', label=False) + anchorColumns('anchor')
+INDEX_COLUMNS = [('chrom', 'tss_start'), ('chrom', 'start'), ('gene',), ('id',), ('anchor1_chrom', 'anchor1_start'),
+	('anchor_chrom', 'anchor_start'), ('element_chrom', 'element_start'), ('target_chrom', 'target_start')]
+
+
+def quote(name):
+	'''
+	Returns a quoted SQL identifier.
+
+	@name 	table or column name
+	@return 	name in double quotes
+	'''
+	return('"' + name.replace('"', '""') + '"')
+
+
+def writeTable(database, table, chr_dict, schema, mode='w'):
+	'''
+	Writes the entries of a chr dictionary to a typed table of a SQLite database and indexes its chromosome, gene and
+	anchor columns.
+
+	@database 	file path of the SQLite database
+	@table 	name of the table
+	@chr_dict 	dictionary with chrom as key and a list of entries as value
+	@schema 	list of (column name, type) tuples of the entries (see MASTER_CONNECTIONS and DEG1_LOOP_CHECKER); use
+				TSS_COLUMNS for the TSS only output of the sparse engine
+	@mode 	'w' to replace the table or 'a' to append to it
+	@return 	number of rows written
+	'''
+	entries = [entry for value in chr_dict.values() for entry in value]
+	positions = [i for i, column in enumerate(schema) if column[0] is not None]
+	columns = [schema[i] for i in positions]
+	connection = sqlite3.connect(database)
+	try:
+		if mode == 'w':
+			connection.execute('DROP TABLE IF EXISTS ' + quote(table))
+		definition = ', '.join(quote(name) + ' ' + kind for name, kind in columns)
+		connection.execute('CREATE TABLE IF NOT EXISTS ' + quote(table) + ' (' + definition + ')')
+		insert = 'INSERT INTO ' + quote(table) + ' VALUES (' + ', '.join('?' * len(columns)) + ')'
+		for i in range(0, len(entries), BATCH_SIZE):  # column affinity converts the text fields to their declared type
+			connection.executemany(insert, [[entry[j] for j in positions] for entry in entries[i:i + BATCH_SIZE]])
+		names = [name for name, kind in columns]
+		for index in INDEX_COLUMNS:
+			if all(name in names for name in index):
+				index_name = quote(table + '_' + '_'.join(index))
+				connection.execute('CREATE INDEX IF NOT EXISTS ' + index_name + ' ON ' + quote(table) + \
+					' (' + ', '.join(quote(name) for name in index) + ')')
+		connection.commit()
+	finally:
+		connection.close()
+	return(len(entries))
+
+
+def readTable(database, table, **filters):
+	'''
+	Returns the rows of a table, optionally only those whose columns equal the given values (e.g. gene='MYC').
+
+	@database 	file path of the SQLite database
+	@table 	name of the table
+	@filters 	column=value pairs the rows have to match
+	@return 	list of sqlite3.Row objects (accessible by column name)
+	'''
+	query = 'SELECT * FROM ' + quote(table)
+	if filters:
+		query += ' WHERE ' + ' AND '.join(quote(name) + ' = ?' for name in filters)
+	connection = sqlite3.connect(database)
+	connection.row_factory = sqlite3.Row
+	try:
+		return(connection.execute(query, list(filters.values())).fetchall())
+	finally:
+		connection.close()
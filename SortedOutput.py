@@ -0,0 +1,142 @@
+"""
+Title:		SortedOutput.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+External merge sort writer for the chr dictionary outputs of AnchorLoops.py, Deg1LoopChecker.py and MasterConnections.py.
+Entries are formatted in batches into sorted runs of bounded size that are spilled to temporary files, then the runs are
+k-way merged into the output file. Lines are ordered by chromosome in natural order (chr1, chr2, ..., chr10, ..., chrX)
+and then by the second and third items of each entry. The number of lines is counted while the output is written so
+the file never needs to be read again.
+"""
+
+import heapq
+import os
+import re
+import tempfile
+
+RUN_SIZE = 500000  # maximum number of entries held in memory per sorted run
+BATCH_SIZE = 65536  # number of lines formatted and written at a time
+BUFFER_SIZE = 1 << 20  # file write buffer in bytes
+
+
+def naturalKey(chrom):
+	'''
+	Returns a sort key that orders chromosome names naturally (chr2 before chr10).
+
+	@chrom 	chromosome name
+	@return 	tuple alternating the text and integer parts of the name
+	'''
+	parts = re.split(r'(\d+)', chrom)
+	return(tuple(int(part) if i % 2 else part for i, part in enumerate(parts)))
+
+
+def fieldKey(field):
+	'''
+	Returns a sort key for a field of a formatted line that orders integers numerically and before text.
+
+	@field 	string field
+	@return 	tuple that can be compared between integer and text fields
+	'''
+	try:
+		return((0, int(field), ''))
+	except ValueError:
+		return((1, 0, field))
+
+
+def lineKey(line):
+	'''
+	Returns the sort key of a run line (chrom, tab, then the formatted entry).
+
+	@line 	line of a run file
+	@return 	tuple of the natural chromosome key and the keys of the second and third items of the entry
+	'''
+	fields = line.split('\t', 4)
+	return((naturalKey(fields[0]), fieldKey(fields[2]), fieldKey(fields[3])))
+
+
+def chrDictEntries(chr_dict):
+	'''
+	Yields the (chrom, entry) pairs of a chr dictionary whose values are lists of entries.
+
+	@chr_dict 	dictionary with chrom as key and a list of lists as value
+	@return 	generator of (chrom, entry) tuples
+	'''
+	for chrom, value in chr_dict.items():
+		for entry in value:
+			yield(chrom, entry)
+
+
+def writeRun(entries, run_dir, run_number):
+	'''
+	Formats a batch of (chrom, entry) pairs, sorts them and writes them to a run file. Every line of a run is prefixed
+	with its chromosome so the merge does not depend on where the chromosome is in the entry.
+
+	@entries 	list of (chrom, entry) tuples
+	@run_dir 	directory in which to write the run
+	@run_number 	number of the run, used to name the file
+	@return 	file path of the run
+	'''
+	lines = [chrom + '\t' + '\t'.join(map(str, entry)) + '\n' for chrom, entry in entries]
+	lines.sort(key=lineKey)
+	run_file = os.path.join(run_dir, 'run' + str(run_number) + '.txt')
+	with open(run_file, 'w', buffering=BUFFER_SIZE) as file:
+		file.writelines(lines)
+	return(run_file)
+
+
+def mergeRuns(run_files, output_file, mode='w'):
+	'''
+	k-way merges sorted run files into the output file, dropping the chromosome prefix of the run lines. Runs are merged
+	stably in the order given so entries with equal keys keep their original order.
+
+	@run_files 	list of run file paths
+	@output_file 	file path to write the merged output to
+	@mode 	'w' to overwrite or 'a' to append to the output file
+	@return 	number of lines written
+	'''
+	count = 0
+	runs = [open(run_file, 'r', buffering=BUFFER_SIZE) for run_file in run_files]
+	try:
+		with open(output_file, mode, buffering=BUFFER_SIZE) as file:
+			batch = []
+			for line in heapq.merge(*runs, key=lineKey):
+				batch.append(line.split('\t', 1)[1])
+				if len(batch) == BATCH_SIZE:
+					file.writelines(batch)
+					count += len(batch)
+					batch = []
+			file.writelines(batch)
+			count += len(batch)
+	finally:
+		for run in runs:
+			run.close()
+	return(count)
+
+
+def writeSortedOutput(entries, output_file, mode='w', run_size=RUN_SIZE, tmp_dir=None):
+	'''
+	Writes (chrom, entry) pairs to the output file sorted by natural chromosome order and then by the second and third
+	items of the entries, holding at most run_size entries in memory at a time.
+
+	@entries 	iterable of (chrom, entry) tuples or a chr dictionary with lists of entries as values
+	@output_file 	file path to write the sorted output to
+	@mode 	'w' to overwrite or 'a' to append to the output file
+	@run_size 	maximum number of entries per sorted run
+	@tmp_dir 	directory for the temporary run files; defaults to the directory of the output file
+	@return 	number of lines written
+	'''
+	if isinstance(entries, dict):
+		entries = chrDictEntries(entries)
+	if tmp_dir is None:
+		tmp_dir = os.path.dirname(os.path.abspath(output_file))
+	with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+		run_files, batch = [], []
+		for entry in entries:
+			batch.append(entry)
+			if len(batch) == run_size:
+				run_files.append(writeRun(batch, run_dir, len(run_files)))
+				batch = []
+		if batch:
+			run_files.append(writeRun(batch, run_dir, len(run_files)))
+		return(mergeRuns(run_files, output_file, mode))
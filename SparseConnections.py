@@ -0,0 +1,286 @@
+"""
+Title:		SparseConnections.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Sparse matrix engine for the 0°, 1°, 2° and 3° TSS connections computed by MasterConnections.py. Instead of scanning
+every TSS against every loop, each HiChIP file is turned into two incidence matrices (loop x anchored feature and
+loop x distal contact bin) and every bed file into a contact bin x feature overlap matrix. Connections then fall out
+of sparse matrix products:
+
+	1° 	TSS x anchored feature = (distal bins x TSS overlap)^T . anchored features
+	2° 	TSS x target = 1° element . (element x target reach)
+	3° 	TSS x element = 1° element . (element x element reach), masked so that neither the TSS nor the intermediate
+		element is reached by a target loop while the final element is (the rules of determineConfirmation)
+
+The values of the matrices are the number of loop paths connecting the pair. Overlaps follow the BinChecker
+definition used throughout the repo (any overlap between the element and the contact bin). Requires numpy and scipy.
+"""
+
+import numpy as np  # version=1.20.2
+from scipy import sparse  # version=1.6.2
+
+
+def intervalTable(keys):
+	'''
+	Converts a list of (chrom, start, stop) tuples into a dictionary of numpy arrays.
+
+	@keys	list of (chrom, start, stop) tuples
+	@return 	dictionary with 'chrom', 'start' and 'stop' arrays in the order of keys
+	'''
+	return({'chrom': np.array([key[0] for key in keys], dtype=object),
+		'start': np.array([int(key[1]) for key in keys], dtype=np.int64),
+		'stop': np.array([int(key[2]) for key in keys], dtype=np.int64)})
+
+
+def indexKeys(keys, index=None):
+	'''
+	Assigns an integer id to each unique key. Returns the ids of keys and the updated index.
+
+	@keys	list of hashable keys
+	@index 	dictionary of already assigned key -> id (optional)
+	@return 	numpy array of ids for keys in order
+	@return 	dictionary of key -> id
+	'''
+	if index is None:
+		index = {}
+	ids = np.empty(len(keys), dtype=np.int64)
+	for i, key in enumerate(keys):
+		if key not in index:
+			index[key] = len(index)
+		ids[i] = index[key]
+	return(ids, index)
+
+
+def overlapMatrix(bins, features):
+	'''
+	Builds a boolean sparse matrix of bins x features marking the features that overlap each bin. For well formed
+	intervals this is identical to BinChecker(feature_start, feature_stop, bin) in MasterConnections.py.
+
+	@bins 	interval table (see intervalTable) of the contact bins
+	@features 	interval table of the features
+	@return 	csr matrix of shape (number of bins, number of features)
+	'''
+	rows, cols = [], []
+	for chrom in np.unique(features['chrom']):
+		b_idx = np.flatnonzero(bins['chrom'] == chrom)
+		if len(b_idx) == 0:
+			continue
+		f_idx = np.flatnonzero(features['chrom'] == chrom)
+		order = np.argsort(features['start'][f_idx], kind='stable')
+		f_idx = f_idx[order]
+		f_start, f_stop = features['start'][f_idx], features['stop'][f_idx]
+		b_start, b_stop = bins['start'][b_idx], bins['stop'][b_idx]
+		max_len = int((f_stop - f_start).max())
+		# features starting before the end of the bin and late enough to possibly reach into it
+		lo = np.searchsorted(f_start, b_start - max_len, side='right')
+		hi = np.searchsorted(f_start, b_stop, side='left')
+		counts = np.maximum(hi - lo, 0)
+		bin_rep = np.repeat(np.arange(len(b_idx)), counts)
+		offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+		feat_pos = np.repeat(lo, counts) + offsets
+		keep = f_stop[feat_pos] > b_start[bin_rep]
+		rows.append(b_idx[bin_rep[keep]])
+		cols.append(f_idx[feat_pos[keep]])
+	rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+	cols = np.concatenate(cols) if cols else np.empty(0, dtype=np.int64)
+	data = np.ones(len(rows), dtype=np.int64)
+	return(sparse.csr_matrix((data, (rows, cols)), shape=(len(bins['chrom']), len(features['chrom']))))
+
+
+def uniqueRows(chr_dict):
+	'''
+	Returns the unique lines of a chr dictionary in their first order; the HiChIP lines of an inter-chromosomal loop are
+	listed under both of its chromosomes (see LoopIndex.chromosomeRows).
+
+	@chr_dict 	chr dictionary of lines
+	@return 	list of the unique lines
+	'''
+	rows = {}
+	for value in chr_dict.values():
+		for item in value:
+			rows.setdefault(tuple(item), item)
+	return(list(rows.values()))
+
+
+def loopIncidence(HiChIP_dict, bin_index):
+	'''
+	Builds the incidence matrices of a HiChIP file generated by AnchorLoops.py. The distal bin of a loop is the contact
+	bin on the other side of the anchored feature (bin 2 if the feature is on the chromosome of bin 1 and overlaps it,
+	otherwise bin 1) as in DistalConnectCheck, and keeps its own chromosome, so an inter-chromosomal loop reaches the
+	features on the other chromosome. Lines whose anchored feature is on neither chromosome of the loop have no distal bin.
+
+	@HiChIP_dict 	chr dictionary of the HiChIP file lines (loop in item[:6], anchored feature in item[10:14])
+	@bin_index 	dictionary of (chrom, start, stop) -> bin id shared by all HiChIP files; updated in place
+	@return 	dictionary containing the 'anchor' (loop x anchored feature) and 'distal' (loop x bin) incidence
+				matrices, the 'anchors' interval table, the anchored feature 'anchor_keys' and the loop 'row_keys'
+	'''
+	rows = uniqueRows(HiChIP_dict)
+	bin1 = intervalTable([(item[0], item[1], item[2]) for item in rows])
+	bin2 = intervalTable([(item[3], item[4], item[5]) for item in rows])
+	anchor = intervalTable([(item[10], item[11], item[12]) for item in rows])
+
+	in_bin1 = (anchor['chrom'] == bin1['chrom']) & (anchor['start'] < bin1['stop']) & (anchor['stop'] > bin1['start'])
+	in_bin2 = ~in_bin1 & (anchor['chrom'] == bin2['chrom'])
+	distal_chrom = np.where(in_bin1, bin2['chrom'], bin1['chrom'])
+	distal_start = np.where(in_bin1, bin2['start'], bin1['start'])
+	distal_stop = np.where(in_bin1, bin2['stop'], bin1['stop'])
+	distal_keys = list(zip(distal_chrom.tolist(), distal_start.tolist(), distal_stop.tolist()))
+	distal_ids, bin_index = indexKeys(distal_keys, bin_index)
+	distal_ids[~(in_bin1 | in_bin2)] = -1
+
+	anchor_keys = [(item[10], int(item[11]), int(item[12])) for item in rows]
+	anchor_ids, anchor_index = indexKeys(anchor_keys)
+	ordered_anchors = sorted(anchor_index, key=anchor_index.get)
+
+	n = len(rows)
+	ones = np.ones(n, dtype=np.int64)
+	return({'anchor': sparse.csr_matrix((ones, (np.arange(n), anchor_ids)), shape=(n, len(anchor_index))),
+		'distal_ids': distal_ids,
+		'anchors': intervalTable(ordered_anchors),
+		'anchor_keys': ordered_anchors,
+		'row_keys': [tuple(item[9:14]) for item in rows]})
+
+
+def distalMatrix(incidence, n_bins):
+	'''
+	Returns the loop x distal bin incidence matrix once the total number of bins is known.
+
+	@incidence 	dictionary returned by loopIncidence
+	@n_bins 	total number of bins in the shared bin index
+	@return 	csr matrix of shape (number of loops, n_bins)
+	'''
+	n = len(incidence['distal_ids'])
+	rows = np.flatnonzero(incidence['distal_ids'] >= 0)  # loops without a distal bin have an empty row
+	return(sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, incidence['distal_ids'][rows])), shape=(n, n_bins)))
+
+
+def diagonal(mask):
+	'''
+	Returns a sparse diagonal matrix that keeps the rows or columns marked in mask when multiplied.
+
+	@mask 	list or numpy array of booleans
+	@return 	dia matrix with mask on the diagonal
+	'''
+	mask = np.asarray(mask, dtype=np.int64)
+	return(sparse.diags(mask, dtype=np.int64))
+
+
+def reachVector(distal, bins, features):
+	'''
+	Returns a boolean array marking the features that lie in the distal bin of at least one loop.
+
+	@distal 	loop x bin incidence matrix
+	@bins 	interval table of the shared bins
+	@features 	interval table of the features
+	@return 	boolean numpy array of length number of features
+	'''
+	hits = np.asarray(distal.sum(axis=0)).ravel() @ overlapMatrix(bins, features)
+	return(np.asarray(hits).ravel() > 0)
+
+
+def connectedAnchorDistal(loop, row_TSS):
+	'''
+	Returns the anchored feature x distal bin matrix of the loops whose anchored feature is connected to a TSS by at
+	least one loop (the loops that continue on to 2° and 3° connections, as the g_e deg1 lists in MasterConnections.py).
+
+	@loop 	dictionary returned by loopIncidence with its 'distal' matrix
+	@row_TSS 	loop x TSS matrix of the TSSs in the distal bin of each loop
+	@return 	csr matrix of shape (number of anchored features, number of bins)
+	'''
+	hit = np.asarray(row_TSS.sum(axis=1)).ravel() > 0
+	hit_keys = set(key for key, h in zip(loop['row_keys'], hit) if h)
+	mask = diagonal([key in hit_keys for key in loop['row_keys']])
+	return((loop['anchor'].T @ mask @ loop['distal']).tocsr())
+
+
+def sparseConnections(HiChIP_target, HiChIP_element1, HiChIP_element2, target_dict, TSS, element1, element2):
+	'''
+	Computes the 0°, 1°, 2° and 3° connection matrices between TSSs and the target using sparse matrix products.
+	Input dictionaries are the ones built by MasterConnections.py.
+
+	@HiChIP_target 	chr dictionary of the target HiChIP file
+	@HiChIP_element1 	chr dictionary of the secondary element HiChIP file
+	@HiChIP_element2 	chr dictionary of the tertiary element HiChIP file
+	@target_dict 	chr dictionary of the target bed file ([name, chrom, start, stop, ID])
+	@TSS 	chr dictionary of the TSS coordinates ([gene_name, chrom, start, stop, gene])
+	@element1 	chr dictionary of the secondary element bed file
+	@element2 	chr dictionary of the tertiary element bed file
+	@return 	dictionary with the 'TSS' lines in matrix row order and the 'deg0' (TSS x target), 'deg1' (TSS x
+				anchored target), 'deg1_element1', 'deg1_element2', 'deg2' (TSS x target) and 'deg3' (TSS x element)
+				csr matrices whose values are the number of loop paths connecting each pair
+	'''
+	TSS_rows = [line for value in TSS.values() for line in value]
+	TSS_table = intervalTable([(line[1], line[2], line[3]) for line in TSS_rows])
+	beds = {}
+	for name, bed_dict in (('target', target_dict), ('element1', element1), ('element2', element2)):
+		beds[name] = intervalTable([(line[1], line[2], line[3]) for value in bed_dict.values() for line in value])
+
+	bin_index = {}
+	loops = {}
+	for name, HiChIP_dict in (('target', HiChIP_target), ('element1', HiChIP_element1), ('element2', HiChIP_element2)):
+		loops[name] = loopIncidence(HiChIP_dict, bin_index)
+	bins = intervalTable(sorted(bin_index, key=bin_index.get))
+	for name in loops:
+		loops[name]['distal'] = distalMatrix(loops[name], len(bin_index))
+
+	bins_TSS = overlapMatrix(bins, TSS_table)
+	result = {'TSS': TSS_rows}
+	result['deg0'] = overlapMatrix(TSS_table, beds['target'])
+
+	# 1°: TSS in the distal bin of a loop anchored in the feature
+	row_TSS = {}
+	for name, loop in loops.items():
+		row_TSS[name] = (loop['distal'] @ bins_TSS).tocsr()  # loop x TSS
+		result['deg1' if name == 'target' else 'deg1_' + name] = (row_TSS[name].T @ loop['anchor']).tocsr()
+
+	# only loops whose anchored feature is itself connected to a TSS continue on to 2° and 3° connections
+	reach = {}
+	for name in ('element1', 'element2'):
+		anchor_distal = connectedAnchorDistal(loops[name], row_TSS[name])
+		reach[name] = {bed: (anchor_distal @ overlapMatrix(bins, beds[bed])).tocsr() for bed in beds}
+
+	# 2°: TSS -> element -> target
+	result['deg2'] = (result['deg1_element1'] @ reach['element1']['target'] +
+		result['deg1_element2'] @ reach['element2']['target']).tocsr()
+
+	# 3°: TSS -> element -> element that is in turn reached by a target loop, while neither the TSS nor the
+	# intermediate element is
+	target_distal = loops['target']['distal']
+	not_TSS = diagonal(~reachVector(target_distal, bins, TSS_table))
+	deg3 = sparse.csr_matrix((len(TSS_rows), len(beds['element1']['chrom']) + len(beds['element2']['chrom'])), dtype=np.int64)
+	for first in ('element1', 'element2'):
+		not_anchor = diagonal(~reachVector(target_distal, bins, loops[first]['anchors']))
+		parts = []
+		for second in ('element1', 'element2'):
+			is_reached = diagonal(reachVector(target_distal, bins, beds[second]))
+			parts.append(result['deg1_' + first] @ not_anchor @ reach[first][second] @ is_reached)
+		deg3 = deg3 + sparse.hstack(parts)
+	result['deg3'] = (not_TSS @ deg3).tocsr()
+	return(result)
+
+
+def connectedTSS(matrix):
+	'''
+	Returns the row indices of the TSSs with at least one connection in a connection matrix.
+
+	@matrix 	TSS x feature sparse matrix
+	@return 	numpy array of TSS row indices
+	'''
+	return(np.flatnonzero(np.diff(matrix.tocsr().indptr) > 0))
+
+
+def connectedTSSDict(TSS_rows, matrix):
+	'''
+	Converts a connection matrix into a chr dictionary of the connected TSS lines (item[:5]) so the results can be
+	summarized with the MasterConnections.py helpers (countUniqueGene, commonGenes, ...).
+
+	@TSS_rows 	list of TSS lines in matrix row order
+	@matrix 	TSS x feature sparse matrix
+	@return 	chr dictionary of the unique connected TSS lines
+	'''
+	result = {}
+	for i in connectedTSS(matrix):  # distinct rows of the TSS lines, which getTSS already made unique
+		line = TSS_rows[i][:5]
+		result.setdefault(line[1], []).append(line)
+	return(result)
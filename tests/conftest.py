@@ -0,0 +1,83 @@
+"""
+Title:		conftest.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+Shared pytest fixture: a tiny genome of bed files and a loop universe with cis and inter-chromosomal loops, small enough
+to follow the 0°-3° connections by hand. The HiChIP files hold every loop anchored in a feature, as AnchorLoops.py
+writes them.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMOTER_DIST = 2500
+NAMES = ('G', 'T', 'E1', 'E2')  # gene_name, target_name, element1_name, element2_name
+
+# chrom start stop id strand; the TSSs are +/- PROMOTER_DIST around the gene start (+) or stop (-)
+GENES = [
+	('chr1', 10000, 20000, 'geneA', '+'),  # 1° to T through a cis loop
+	('chr2', 50000, 60000, 'geneB', '+'),  # 1° to T through a trans loop
+	('chr1', 300000, 310000, 'geneC', '+'),  # 2° to T via e1a through trans loops
+	('chr1', 500000, 510000, 'geneD', '-'),  # 3° to T via e1b and e2a
+	('chr1', 200000, 201000, 'geneE', '+'),  # 0°, overlaps the target
+	('chr1', 50000, 60000, 'geneG', '+'),  # at the chr2 coordinates of the trans far bin, but on chr1: not connected
+]
+TARGETS = [('chr1', 200000, 200500, 'T1')]
+ELEMENT1 = [('chr2', 100000, 100500, 'e1a'), ('chr2', 300000, 300500, 'e1b')]
+ELEMENT2 = [('chr1', 400000, 400500, 'e2a')]
+
+# loop universe (chr1 start1 stop1 chr2 start2 stop2 count fdr id label)
+LOOPS = [
+	('chr1', 5000, 15000, 'chr1', 195000, 205000, 10, 0.01, 'x', 'loop'),  # geneA - T1
+	('chr1', 195000, 205000, 'chr2', 45000, 55000, 12, 0.01, 'x', 'loop'),  # T1 - geneB
+	('chr1', 395000, 405000, 'chr1', 195000, 205000, 8, 0.01, 'x', 'loop'),  # e2a - T1
+	('chr2', 95000, 105000, 'chr1', 295000, 305000, 9, 0.01, 'x', 'loop'),  # e1a - geneC
+	('chr2', 95000, 105000, 'chr1', 195000, 205000, 7, 0.01, 'x', 'loop'),  # e1a - T1
+	('chr1', 505000, 515000, 'chr2', 295000, 305000, 6, 0.01, 'x', 'loop'),  # geneD - e1b
+	('chr2', 295000, 305000, 'chr1', 395000, 405000, 5, 0.01, 'x', 'loop'),  # e1b - e2a
+	('chr1', 395000, 405000, 'chr1', 5000, 15000, 4, 0.01, 'x', 'loop'),  # e2a - geneA
+]
+
+
+def anchoredLoops(features):
+	'''
+	Returns the AnchorLoops.py output of the loop universe: every loop with a contact bin overlapping a feature on the
+	bin's chromosome, followed by the feature.
+
+	@features 	list of (chrom, start, stop, id) tuples
+	@return 	list of output lines
+	'''
+	lines = []
+	for loop in LOOPS:
+		for feature in features:
+			if any([feature[0] == chrom and feature[1] <= stop and feature[2] >= start \
+				for chrom, start, stop in (loop[0:3], loop[3:6])]):
+				lines.append(loop + feature)
+	return(lines)
+
+
+def writeLines(path, lines):
+	with open(path, 'w') as file:
+		for line in lines:
+			file.write('\t'.join(map(str, line)) + '\n')
+	return(str(path))
+
+
+@pytest.fixture
+def loopFiles(tmp_path):
+	'''
+	Writes the fixture genome to tab delimited files.
+
+	@tmp_path 	pytest temporary directory
+	@return 	dictionary of the file paths keyed as the files argument of MasterConnections.loadInputs
+	'''
+	return({'HiChIP_target': writeLines(tmp_path / 'H_target.txt', anchoredLoops(TARGETS)),
+		'HiChIP_element1': writeLines(tmp_path / 'H_e1.txt', anchoredLoops(ELEMENT1)),
+		'HiChIP_element2': writeLines(tmp_path / 'H_e2.txt', anchoredLoops(ELEMENT2)),
+		'target': writeLines(tmp_path / 'target.bed', TARGETS), 'gene': writeLines(tmp_path / 'genes.bed', GENES),
+		'element1': writeLines(tmp_path / 'e1.bed', ELEMENT1), 'element2': writeLines(tmp_path / 'e2.bed', ELEMENT2)})
@@ -0,0 +1,40 @@
+"""
+Title:		test_gene_scores.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+The gene scores of the loop engine (optional argument scores=) report the loop counts of the fixture genome's paths,
+including the target loop that confirms a 3° path.
+"""
+
+import MasterConnections
+from conftest import NAMES, PROMOTER_DIST
+
+
+def geneScores(files, cis_only=False):
+	inputs = MasterConnections.loadInputs(files, NAMES, PROMOTER_DIST, cis_only=cis_only)
+	return(MasterConnections.runAnalysis(inputs, 'loops')['scores'])
+
+
+def test_scoresFollowTheLoopCounts(loopFiles):
+	scores = geneScores(loopFiles)
+	assert scores['geneE']['deg0'] == [1]
+	assert scores['geneA']['deg1'] == [1, 10, 10, 10]
+	assert scores['geneB']['best'] == (12, 'deg1', 'geneB -12- T1')
+	assert scores['geneC']['deg2'] == [1, 7, 7, 7]
+	assert scores['geneC']['best'] == (7, 'deg2', 'geneC -9- e1a -7- T1')
+	assert scores['geneE']['deg2'] == [2, 15, 8, 7]
+	assert scores['geneE']['best'] == (8, 'deg2', 'geneE -8- e2a -8- T1')
+	# confirmed by the e2a - T1 loop (count 8), not by the other T1 loops scanned
+	assert scores['geneD']['deg3'] == [1, 5, 5, 5]
+	assert scores['geneD']['best'] == (5, 'deg3', 'geneD -6- e1b -5- e2a -8- T1')
+	assert 'geneG' not in scores
+
+
+def test_writtenScoresKeepWholeCounts(loopFiles, tmp_path):
+	path = str(tmp_path / 'scores.tsv')
+	MasterConnections.writeGeneScores(geneScores(loopFiles), path)
+	with open(path, 'r') as file:
+		rows = {line.split('\t')[0]: line.rstrip('\n').split('\t') for line in file}
+	assert rows['geneD'][-3:] == ['deg3', '5', 'geneD -6- e1b -5- e2a -8- T1']
+	assert rows['geneA'][2:6] == ['1', '10', '10', '10']
@@ -0,0 +1,42 @@
+"""
+Title:		test_permutation_null.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+The permutation null counts the observed target peaks like MasterConnections.py counts its outputs, including the
+connections through inter-chromosomal loops of the fixture genome.
+"""
+
+import pytest
+
+import MasterConnections
+import PermutationNull
+from conftest import NAMES, PROMOTER_DIST
+
+
+@pytest.mark.parametrize('cis_only', [False, True])
+def test_connectionCountsMatchCountUniqueGene(loopFiles, cis_only):
+	inputs = MasterConnections.loadInputs(loopFiles, NAMES, PROMOTER_DIST, cis_only=cis_only)
+	degrees = MasterConnections.runAnalysis(inputs, 'loops')
+	loops = PermutationNull.HiChIPLoops(inputs['HiChIP_target'], inputs['HiChIP_element1'], inputs['HiChIP_element2'])
+	model = PermutationNull.nullModel(inputs, loops)
+	targets = PermutationNull.intervalTable([(line[1], line[2], line[3]) for value in inputs['target'].values() for line in value])
+
+	counts = dict(zip(PermutationNull.DEGREES, PermutationNull.connectionCounts(model, targets)))
+	for key in ('deg0', 'deg1', 'deg2', 'deg3'):
+		assert counts[key] == MasterConnections.countUniqueGene(degrees[key]), key
+	assert counts['all'] == MasterConnections.countUniqueGene(MasterConnections.uniqueGeneDict(degrees['deg0'], \
+		degrees['deg1'], degrees['deg2'], degrees['deg3']))
+
+
+def test_readLoopsKeepsTheSecondChromosome(loopFiles):
+	loops = PermutationNull.readLoops(loopFiles['HiChIP_target'])
+	assert ('chr1', 195000, 205000, 'chr2', 45000, 55000) in loops
+	assert all([loop[0] == loop[3] for loop in PermutationNull.readLoops(loopFiles['HiChIP_target'], cis_only=True)])
+
+
+def test_missingChromosomeSizeIsNamed():
+	targets = PermutationNull.intervalTable([('chr1', 100, 200), ('chrUn', 100, 200)])
+	with pytest.raises(ValueError, match='chrUn'):
+		PermutationNull.shuffleGroups(targets, {'chr1': 1000})
+	assert len(PermutationNull.shuffleGroups(targets, {'chr1': 1000, 'chrUn': 1000})) == 2
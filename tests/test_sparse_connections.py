@@ -0,0 +1,39 @@
+"""
+Title:		test_sparse_connections.py
+Date Created:	10/18/26
+Version:	Python 3.7.9
+
+The sparse matrix engine (engine=sparse) finds the same connected TSSs of every degree as the loop engine on the fixture
+genome, with and without its inter-chromosomal loops.
+"""
+
+import pytest
+
+import MasterConnections
+from conftest import NAMES, PROMOTER_DIST
+
+DEGREES = ('deg0', 'deg1', 'deg1_element1', 'deg1_element2', 'deg2', 'deg3')
+
+
+def connectedGenes(files, engine, cis_only):
+	inputs = MasterConnections.loadInputs(files, NAMES, PROMOTER_DIST, cis_only=cis_only)
+	degrees = MasterConnections.runAnalysis(inputs, engine)
+	return({key: set([item[4] for value in degrees[key].values() for item in value]) for key in DEGREES})
+
+
+@pytest.mark.parametrize('cis_only', [False, True])
+def test_sparseEngineMatchesLoopEngine(loopFiles, cis_only):
+	assert connectedGenes(loopFiles, 'sparse', cis_only) == connectedGenes(loopFiles, 'loops', cis_only)
+
+
+def test_transLoopsReachTheFarChromosome(loopFiles):
+	genes = connectedGenes(loopFiles, 'loops', False)
+	assert genes['deg0'] == {'geneE'}
+	assert genes['deg1'] == {'geneA', 'geneB'}  # geneG on chr1 is not in the chr2 far bin of the trans loop
+	assert genes['deg2'] == {'geneA', 'geneC', 'geneE'}
+	assert genes['deg3'] == {'geneD'}
+
+	cis = connectedGenes(loopFiles, 'loops', True)
+	assert cis['deg1'] == {'geneA'}
+	assert cis['deg2'] == {'geneA', 'geneE'}
+	assert not cis['deg3']